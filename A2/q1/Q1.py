@@ -1,17 +1,25 @@
 import sys
-import urllib.request
+import csv
+import argparse
+import os
+import functools
 import json
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+from kmeans_sweep import sweep, parallel_sweep
+from silhouette import sample_indices, score_fit
+from dataset_cache import dataset_path, load_dataset
+from elbow_search import coarse_to_fine
 
-def load_data(arg):
-    """Load dataset from either a .npy file or a URL based on the argument."""
+def load_data(arg, mmap=False, data_dir=None, offline=False, verify=False):
+    """
+    Load dataset from either a .npy file or, for a dataset number, the local
+    cache (see dataset_cache.py), a stand-in data_dir, or the course server.
+    """
 
     if arg.endswith('.npy'):
         try:
-            return np.load(arg)
+            return np.load(arg, mmap_mode='r' if mmap else None)
         except Exception as e:
             print(f"Error loading .npy file: {e}", file=sys.stderr)
             sys.exit(1)
@@ -19,19 +27,17 @@ def load_data(arg):
     else:
         try:
             dataset_num = int(arg)
-            url = f"http://hulk.cse.iitd.ac.in:3000/dataset?student_id=aib252564&dataset_num={dataset_num}"
-            with urllib.request.urlopen(url) as response:
-                raw_data = response.read().decode('utf-8')
-                data = json.loads(raw_data)
-
-                with open(f"dataset_{dataset_num}.npy", 'wb') as f:
-                    np.save(f, np.array(data["X"]))
-
-                return np.array(data["X"])
-            
         except ValueError:
             print("Argument must be either dataset_num (int) or path to .npy file", file=sys.stderr)
             sys.exit(1)
+
+        try:
+            url = f"http://hulk.cse.iitd.ac.in:3000/dataset?student_id=aib252564&dataset_num={dataset_num}"
+            return load_dataset(dataset_num, url, data_dir=data_dir, offline=offline,
+                                verify=verify)
+        except FileNotFoundError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
         except Exception as e:
             print(f"Error fetching dataset from URL: {e}", file=sys.stderr)
             sys.exit(1)
@@ -61,38 +67,122 @@ def find_elbow_point(k_values, inertias):
     return elbow_k
 
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage:", file=sys.stderr)
-        print("  python3 Q1.py <dataset_num>", file=sys.stderr)
-        print("  python3 Q1.py <path_to_dataset>.npy", file=sys.stderr)
-        sys.exit(1)
+def write_results(path, rows, meta):
+    """Per-k inertia and silhouette as CSV or, for any other extension, JSON."""
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'meta': meta, 'results': rows}, f, indent=2)
 
-    arg = sys.argv[1]
-    X = load_data(arg)
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 Q1.py <dataset_num> | <path_to_dataset>.npy [options]")
+    parser.add_argument('dataset', help="Dataset number (downloaded) or path to a .npy file")
+    parser.add_argument('--mode', choices=('full', 'minibatch'), default='full',
+                        help="full: KMeans in memory; minibatch: MiniBatchKMeans over "
+                             "chunks of the memory-mapped .npy")
+    parser.add_argument('--warm_start', action='store_true',
+                        help="Initialise each k from the k-1 centres by splitting the worst cluster")
+    parser.add_argument('--chunk_size', type=int, default=4096,
+                        help="Rows per mini-batch in minibatch mode (raised to k when smaller)")
+    parser.add_argument('--max_epochs', type=float, default=1.0,
+                        help="Passes over the data per k in minibatch mode")
+    parser.add_argument('--max_k', type=int, default=15)
+    parser.add_argument('--search', choices=('exhaustive', 'coarse'), default='exhaustive',
+                        help="exhaustive: fit every k in 1..max_k; coarse: fit a geometric "
+                             "grid, then refine around the elbow until it is stable")
+    parser.add_argument('--coarse_grid', type=int, default=8,
+                        help="Number of k values in the initial coarse grid")
+    parser.add_argument('--refine', type=int, default=2,
+                        help="k values fitted on each side of the elbow per refinement")
+    parser.add_argument('--patience', type=int, default=2,
+                        help="Stop after this many refinements without the elbow moving")
+    parser.add_argument('--silhouette', choices=('blockwise', 'sampled', 'simplified'),
+                        default=None,
+                        help="blockwise: sampled points against all points; sampled: "
+                             "within the sample only; simplified: centroid-based "
+                             "(default: blockwise in full mode, sampled in minibatch mode)")
+    parser.add_argument('--silhouette_sample', type=int, default=None,
+                        help="Score the silhouette on this many sampled points "
+                             "(default: all points in full mode, 10000 in minibatch mode)")
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help="Confidence level of the silhouette interval")
+    parser.add_argument('--n_jobs', type=int, default=1,
+                        help="Threads for the blockwise silhouette")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Fit different k values on this many processes")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="BLAS/OpenMP threads per worker process (with --workers > 1)")
+    parser.add_argument('--results', default='results.json',
+                        help="Per-k inertia and silhouette (.json, or .csv)")
+    parser.add_argument('--data_dir', default=os.environ.get('Q1_DATA_DIR'),
+                        help="Local stand-in for the course server: dataset_<n>.npy, or the "
+                             "saved JSON response as dataset<n>.csv / dataset_<n>.json")
+    parser.add_argument('--offline', action='store_true',
+                        help="Never fetch; fail if the dataset is not cached or in --data_dir")
+    parser.add_argument('--verify', action='store_true',
+                        help="Re-hash the cached dataset even if its size and mtime match")
+    args = parser.parse_args()
+    if args.workers > 1 and args.warm_start:
+        parser.error("--warm_start fits k values in sequence; it needs --workers 1")
+
+    arg = args.dataset
+    X = load_data(arg, mmap=args.mode == 'minibatch' or args.workers > 1,
+                  data_dir=args.data_dir, offline=args.offline, verify=args.verify)
+    # Workers memory-map the .npy; a dataset number is served from the cache file.
+    data_path = arg if arg.endswith('.npy') else dataset_path(int(arg))
+    sil_sample = args.silhouette_sample
+    if sil_sample is None and args.mode == 'minibatch':
+        sil_sample = 10000
+    sil_method = args.silhouette or ('sampled' if args.mode == 'minibatch' else 'blockwise')
 
     if len(X) == 0:
         print("Dataset is empty.", file=sys.stderr)
         sys.exit(1)
 
-    inertias = []
-    silhouette_avg = []
-    max_k = min(15, len(X))
-    k_range = list(range(1, max_k + 1))
-
-    for k in k_range:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init='auto')
-        cluster_labels = kmeans.fit_predict(X)
-        kmeans.fit(X)
-        inertias.append(kmeans.inertia_)
+    max_k = min(args.max_k, len(X))
+    sil_idx = sample_indices(len(X), sil_sample, seed=42)
+    score = functools.partial(score_fit, idx=sil_idx, method=sil_method,
+                              confidence=args.confidence, n_jobs=args.n_jobs)
+    fit_opts = dict(mode=args.mode, chunk_size=args.chunk_size, max_epochs=args.max_epochs)
+
+    def fit_batch(ks):
+        if args.workers > 1:
+            return parallel_sweep(data_path, ks, args.workers, threads=args.threads,
+                                  score=score, **fit_opts)
+        rows = []
+        for fit in sweep(X, ks, warm_start=args.warm_start, **fit_opts):
+            row = {'k': fit['k'], 'inertia': fit['inertia'], 'seconds': fit['seconds']}
+            row.update(score(X, fit))
+            rows.append(row)
+        return rows
+
+    elbow_history = None
+    if args.search == 'coarse':
+        rows, elbow_history = coarse_to_fine(fit_batch, 1, max_k, find_elbow_point,
+                                             grid=args.coarse_grid, per_side=args.refine,
+                                             patience=args.patience)
+    else:
+        rows = fit_batch(list(range(1, max_k + 1)))
 
-        if k > 1:
-            silhouette_avg.append(silhouette_score(X, cluster_labels))
-        else:
-            silhouette_avg.append(0)
+    k_range = [row['k'] for row in rows]
+    inertias = [row['inertia'] for row in rows]
+    silhouette_avg = [row['silhouette'] for row in rows]
+    silhouette_ci = [(row['silhouette_lo'], row['silhouette_hi']) for row in rows]
 
     optimal_k = find_elbow_point(k_range, inertias)
     optimal_k_sil = k_range[np.argmax(silhouette_avg)]
+    write_results(args.results, rows,
+                  {'dataset': arg, 'mode': args.mode, 'warm_start': args.warm_start,
+                   'workers': args.workers, 'silhouette': sil_method,
+                   'silhouette_sample': len(sil_idx), 'confidence': args.confidence,
+                   'search': args.search, 'elbow_history': elbow_history,
+                   'optimal_k': int(optimal_k), 'optimal_k_silhouette': int(optimal_k_sil)})
 
     plt.figure()
     plt.plot(k_range, inertias, 'bo-')
@@ -117,6 +207,8 @@ def main():
     ax2 = ax1.twinx() 
     ax2.set_ylabel('Silhouette Score (Higher is better)', color='green')
     ax2.plot(k_range, silhouette_avg, 'gs-', label='Silhouette Score')
+    ax2.fill_between(k_range, [lo for lo, _ in silhouette_ci], [hi for _, hi in silhouette_ci],
+                     color='green', alpha=0.2)
     ax2.tick_params(axis='y', labelcolor='green')
 
     plt.title('Elbow and Silhouette Analysis')
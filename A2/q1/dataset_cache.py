@@ -0,0 +1,158 @@
+"""
+Local cache for the course-server datasets used by Q1.
+
+`dataset_<n>.npy` is written once, when the dataset is first fetched, and a
+manifest (`dataset_manifest.json`, same directory) records its size, mtime,
+content hash, shape, dtype and where it came from. Later runs load the cached
+file memory-mapped after checking it against the manifest:
+
+  - size and mtime unchanged: trusted as is (no read of the data);
+  - otherwise, or with verify=True: the content hash is recomputed and the
+    file is re-fetched if it no longer matches.
+
+A `dataset_<n>.npy` without a manifest entry (e.g. written by an older Q1) is
+adopted if it parses as a .npy file, and re-fetched otherwise (git-lfs pointer
+files, truncated downloads).
+
+A local stand-in directory (data_dir) is searched before the network for
+`dataset_<n>.npy`, or for the server's JSON response saved as
+`dataset<n>.csv` / `dataset_<n>.json` (`//` comment lines are skipped), so the
+tool can run fully offline.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import urllib.request
+
+import numpy as np
+
+MANIFEST = 'dataset_manifest.json'
+
+
+def dataset_path(num, cache_dir='.'):
+    return os.path.join(cache_dir, f"dataset_{num}.npy")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_manifest(cache_dir='.'):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _record(cache_dir, path, source):
+    """Hash a cached file and store its manifest entry."""
+    st = os.stat(path)
+    arr = np.load(path, mmap_mode='r')
+    manifest = read_manifest(cache_dir)
+    manifest[os.path.basename(path)] = {
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'blake2b': file_digest(path),
+        'shape': list(arr.shape),
+        'dtype': str(arr.dtype),
+        'source': source,
+        'cached_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    _write_manifest(cache_dir, manifest)
+
+
+def _is_npy(path):
+    try:
+        np.load(path, mmap_mode='r')
+        return True
+    except Exception:
+        return False
+
+
+def validate(path, cache_dir='.', verify=False):
+    """True if `path` is a usable cache entry; adopts valid unlisted files."""
+    if not os.path.exists(path):
+        return False
+    entry = read_manifest(cache_dir).get(os.path.basename(path))
+    if entry is None:
+        if not _is_npy(path):
+            return False
+        _record(cache_dir, path, 'local')
+        return True
+
+    st = os.stat(path)
+    if st.st_size != entry['size']:
+        return False
+    if st.st_mtime_ns == entry['mtime_ns'] and not verify:
+        return True
+    if file_digest(path) != entry['blake2b']:
+        return False
+    entry['mtime_ns'] = st.st_mtime_ns
+    manifest = read_manifest(cache_dir)
+    manifest[os.path.basename(path)] = entry
+    _write_manifest(cache_dir, manifest)
+    return True
+
+
+def parse_response(text):
+    """X from the server's JSON response (lines starting with // are skipped)."""
+    body = '\n'.join(line for line in text.splitlines() if not line.lstrip().startswith('//'))
+    return np.array(json.loads(body)["X"])
+
+
+def _save(path, X):
+    tmp = path + '.tmp.npy'
+    np.save(tmp, X)
+    os.replace(tmp, path)
+
+
+def _from_data_dir(num, data_dir, path):
+    """Copy or convert a stand-in file into the cache; returns its source path or None."""
+    npy = os.path.join(data_dir, f"dataset_{num}.npy")
+    if os.path.abspath(npy) != os.path.abspath(path) and _is_npy(npy):
+        shutil.copyfile(npy, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return npy
+    for name in (f"dataset{num}.csv", f"dataset_{num}.json"):
+        src = os.path.join(data_dir, name)
+        if os.path.exists(src):
+            with open(src) as fh:
+                _save(path, parse_response(fh.read()))
+            return src
+    return None
+
+
+def load_dataset(num, url, cache_dir='.', data_dir=None, offline=False,
+                 verify=False, mmap=True):
+    """
+    Dataset `num`, from the cache if valid, else from data_dir, else from `url`.
+
+    Raises FileNotFoundError when offline and no local copy exists.
+    """
+    path = dataset_path(num, cache_dir)
+    if not validate(path, cache_dir, verify):
+        source = _from_data_dir(num, data_dir, path) if data_dir else None
+        if source is None:
+            if offline:
+                raise FileNotFoundError(f"dataset {num} has no valid copy in '{cache_dir}'"
+                                        + (f" or present in '{data_dir}'" if data_dir else ""))
+            with urllib.request.urlopen(url) as response:
+                _save(path, parse_response(response.read().decode('utf-8')))
+            source = url
+        _record(cache_dir, path, source)
+    return np.load(path, mmap_mode='r' if mmap else None)
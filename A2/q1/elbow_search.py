@@ -0,0 +1,59 @@
+"""
+Coarse-to-fine search for the elbow over a large k range.
+
+The elbow criterion is unchanged (the fitted point farthest from the chord
+between the first and last k); only the set of fitted k values differs. A
+geometric grid over [k_min, k_max] is fitted first, because inertia curves
+bend at small k and flatten out. Each refinement then fits a few evenly spaced
+k values inside the two gaps next to the current elbow. The search stops
+once both neighbours of the elbow are adjacent integers, or once the elbow
+has not moved for `patience` consecutive refinements.
+"""
+
+import numpy as np
+
+
+def coarse_grid(k_min, k_max, size):
+    """About `size` geometrically spaced integers from k_min to k_max inclusive."""
+    if k_max - k_min + 1 <= size:
+        return list(range(k_min, k_max + 1))
+    return sorted({int(round(k)) for k in np.geomspace(k_min, k_max, size)})
+
+
+def refine_points(fitted, elbow, per_side=2):
+    """Up to per_side unfitted k values spread evenly inside each gap next to the elbow."""
+    ks = sorted(fitted)
+    i = ks.index(elbow)
+    new = set()
+    for lo, hi in ((ks[max(i - 1, 0)], elbow), (elbow, ks[min(i + 1, len(ks) - 1)])):
+        if hi - lo > 1:
+            new.update(int(round(k)) for k in np.linspace(lo, hi, per_side + 2)[1:-1])
+    return sorted(new - set(ks))
+
+
+def coarse_to_fine(fit_batch, k_min, k_max, elbow, grid=8, per_side=2, patience=2):
+    """
+    Locate the elbow while fitting as few k values as possible.
+
+    fit_batch(ks) fits a list of k values and returns one row (dict with 'k'
+    and 'inertia') per k; elbow(k_values, inertias) returns the elbow k.
+    Returns (rows sorted by k, list of the elbow after every round).
+    """
+    rows = {}
+    for row in fit_batch(coarse_grid(k_min, k_max, grid)):
+        rows[row['k']] = row
+
+    history = []
+    stable = 0
+    while True:
+        ks = sorted(rows)
+        best = elbow(ks, [rows[k]['inertia'] for k in ks])
+        stable = stable + 1 if history and history[-1] == best else 0
+        history.append(best)
+        new = refine_points(ks, best, per_side)
+        if not new or stable >= patience:
+            break
+        for row in fit_batch(new):
+            rows[row['k']] = row
+
+    return [rows[k] for k in sorted(rows)], history
@@ -0,0 +1,195 @@
+"""
+KMeans sweep over k for the elbow method.
+
+Every k is fitted exactly once, by one of two engines:
+
+  full       sklearn KMeans on the in-memory array (the original behaviour).
+  minibatch  MiniBatchKMeans fed with fixed-size chunks of a (possibly
+             memory-mapped) array for a bounded number of epochs; labels and
+             inertia then come from one more streaming pass, so memory beyond
+             the label vector stays O(chunk_size * k).
+
+With warm starting, the initial centres for k are the centres of the previous
+k plus one new centre per missing cluster, placed at the point farthest from
+its centre inside the cluster with the largest SSE ("split the worst
+cluster"), instead of a fresh k-means++ initialisation.
+
+Without warm starting the k values are independent: full mode seeds every
+KMeans with random_state itself (as the original script did), and minibatch
+mode draws its chunk order from an RNG stream seeded with (random_state, k).
+Each fit depends only on k and random_state, so parallel_sweep can fit them
+on a process pool and get the same numbers as the sequential sweep.
+"""
+
+import math
+import time
+import multiprocessing as mp
+
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from threadpoolctl import threadpool_limits
+
+
+def iter_chunks(X, chunk_size, order=None):
+    """Yield (start, chunk) for consecutive row blocks of X, as float64."""
+    n_chunks = math.ceil(len(X) / chunk_size)
+    for c in (range(n_chunks) if order is None else order):
+        start = c * chunk_size
+        yield start, np.asarray(X[start:start + chunk_size], dtype=np.float64)
+
+
+def assign(X, centers, chunk_size=65536):
+    """
+    Nearest-centre assignment in one streaming pass.
+
+    Returns (labels, inertia, sse, farthest): the label per row, the total
+    SSE, the SSE per cluster and, per cluster, the index of its member
+    farthest from the centre (-1 for an empty cluster).
+    """
+    k = len(centers)
+    c_sq = np.einsum('ij,ij->i', centers, centers)
+    labels = np.empty(len(X), dtype=np.int32)
+    sse = np.zeros(k)
+    far_d = np.full(k, -1.0)
+    farthest = np.full(k, -1, dtype=np.int64)
+
+    for start, chunk in iter_chunks(X, chunk_size):
+        d = np.einsum('ij,ij->i', chunk, chunk)[:, None] - 2.0 * chunk @ centers.T + c_sq
+        lab = np.argmin(d, axis=1)
+        dist = np.maximum(d[np.arange(len(chunk)), lab], 0.0)
+        labels[start:start + len(chunk)] = lab
+        np.add.at(sse, lab, dist)
+
+        order = np.lexsort((dist, lab))
+        last = np.r_[lab[order][1:] != lab[order][:-1], True]
+        for i in order[last]:
+            if dist[i] > far_d[lab[i]]:
+                far_d[lab[i]] = dist[i]
+                farthest[lab[i]] = start + i
+
+    return labels, float(sse.sum()), sse, farthest
+
+
+def split_worst(X, centers, sse, farthest, k):
+    """
+    Grow `centers` to k centres by splitting the clusters with the largest SSE.
+
+    Each split adds the farthest member of one cluster as a new centre.
+    Returns None when there are not enough splittable clusters.
+    """
+    need = k - len(centers)
+    worst = [c for c in np.argsort(-sse, kind='stable') if farthest[c] >= 0 and sse[c] > 0]
+    if need > len(worst):
+        return None
+    new = np.asarray(X[np.sort(farthest[worst[:need]])], dtype=np.float64)
+    return np.vstack([centers, new])
+
+
+def _fit_full(X, k, init, random_state):
+    if init is None:
+        km = KMeans(n_clusters=k, random_state=random_state, n_init='auto')
+    else:
+        km = KMeans(n_clusters=k, init=init, n_init=1, random_state=random_state)
+    labels = km.fit_predict(X)
+    return km.cluster_centers_, labels, float(km.inertia_)
+
+
+def _fit_minibatch(X, k, init, chunk_size, max_epochs, random_state):
+    # partial_fit needs at least k rows, so smaller chunks are merged.
+    chunk_size = max(chunk_size, k)
+    rng = np.random.default_rng([random_state, k])
+    n_chunks = math.ceil(len(X) / chunk_size)
+    if k == 1 and init is None:
+        total = np.zeros(X.shape[1])
+        for _, chunk in iter_chunks(X, chunk_size):
+            total += chunk.sum(axis=0)
+        return (total / len(X))[None, :]
+
+    km = MiniBatchKMeans(n_clusters=k, init='k-means++' if init is None else init,
+                         n_init=1, batch_size=chunk_size, random_state=random_state)
+    steps = max(1, math.ceil(max_epochs * n_chunks))
+    order = []
+    while len(order) < steps:
+        perm = list(rng.permutation(n_chunks))
+        # The first partial_fit initialises the centres, so it needs a full chunk.
+        if not order and len(perm) > 1 and perm[0] == n_chunks - 1:
+            perm[0], perm[1] = perm[1], perm[0]
+        order.extend(perm)
+
+    for _, chunk in iter_chunks(X, chunk_size, order[:steps]):
+        if len(chunk) >= k or hasattr(km, 'cluster_centers_'):
+            km.partial_fit(chunk)
+    return km.cluster_centers_
+
+
+def fit_k(X, k, mode='full', init=None, chunk_size=4096, max_epochs=1.0,
+          random_state=42, split_stats=False):
+    """
+    Fit one k and return a dict with k, inertia, labels, centers, seconds
+    (plus sse and farthest from `assign` when split_stats is set).
+    """
+    t0 = time.time()
+    sse = farthest = None
+    if mode == 'full':
+        centers, labels, inertia = _fit_full(X, k, init, random_state)
+        if split_stats:
+            _, _, sse, farthest = assign(X, centers)
+    elif mode == 'minibatch':
+        centers = _fit_minibatch(X, k, init, chunk_size, max_epochs, random_state)
+        labels, inertia, sse, farthest = assign(X, centers)
+    else:
+        raise ValueError(f"unknown sweep mode '{mode}'")
+    return {'k': k, 'inertia': inertia, 'labels': labels, 'centers': centers,
+            'sse': sse, 'farthest': farthest, 'seconds': time.time() - t0}
+
+
+def sweep(X, k_values, mode='full', warm_start=False, chunk_size=4096,
+          max_epochs=1.0, random_state=42):
+    """Fit KMeans once for every k in k_values (increasing), yielding fit_k dicts."""
+    prev = None
+    for k in k_values:
+        init = None
+        if warm_start and prev is not None and prev['k'] < k:
+            init = split_worst(X, prev['centers'], prev['sse'], prev['farthest'], k)
+        prev = fit_k(X, k, mode, init, chunk_size, max_epochs, random_state,
+                     split_stats=warm_start)
+        yield prev
+
+
+_WORKER = {}
+
+
+def _init_worker(path, threads, fit_opts, score):
+    # Cap BLAS/OpenMP threads so `workers` processes do not oversubscribe the CPUs.
+    _WORKER['limits'] = threadpool_limits(limits=threads)
+    _WORKER['X'] = np.load(path, mmap_mode='r')
+    _WORKER['fit_opts'] = fit_opts
+    _WORKER['score'] = score
+
+
+def _fit_task(k):
+    X = _WORKER['X']
+    fit = fit_k(X, k, **_WORKER['fit_opts'])
+    row = {'k': k, 'inertia': fit['inertia'], 'seconds': fit['seconds']}
+    if _WORKER['score'] is not None:
+        row.update(_WORKER['score'](X, fit))
+    return row
+
+
+def parallel_sweep(path, k_values, workers, threads=1, score=None, **fit_opts):
+    """
+    Fit every k in k_values on a pool of `workers` processes.
+
+    Each worker memory-maps the .npy at `path` (so the data is shared through
+    the page cache instead of being copied), runs BLAS/OpenMP with `threads`
+    threads and returns one row per k: k, inertia, seconds, plus whatever
+    score(X, fit) returns (a picklable callable, run in the worker so labels
+    never cross the process boundary). Rows come back sorted by k.
+    fit_opts are passed to fit_k (mode, chunk_size, max_epochs, random_state).
+    """
+    # Largest k first: they take longest, so the pool finishes more evenly.
+    order = sorted(k_values, reverse=True)
+    with mp.Pool(workers, initializer=_init_worker,
+                 initargs=(path, threads, fit_opts, score)) as pool:
+        rows = list(pool.imap_unordered(_fit_task, order))
+    return sorted(rows, key=lambda row: row['k'])
@@ -0,0 +1,143 @@
+"""
+Bounded-memory silhouette estimates for the elbow sweep.
+
+The silhouette of a point i is s(i) = (b - a) / max(a, b), where a is its mean
+distance to the other members of its cluster and b the smallest mean distance
+to another cluster (s(i) = 0 in a singleton cluster, as in sklearn).
+
+Three estimators, all over the same row sample `idx` (or every row):
+
+  blockwise   exact s(i) of the sampled points against all of X. X is streamed
+              in row chunks and each chunk adds its distances to the
+              per-cluster distance sums of a block of sampled points, so memory
+              stays O(block_size * chunk_size + sample * k) and time is
+              O(sample * n). Chunks are split across threads (the work is
+              BLAS-bound and releases the GIL). With every row sampled this is
+              sklearn's silhouette_score.
+  sampled     the silhouette of the subsample on its own (what
+              silhouette_score(sample_size=m) computes): O(m^2), independent
+              of n, for datasets where even O(m * n) is too slow.
+  simplified  the centroid-based silhouette: a and b are the distances to the
+              own and nearest other centre, O(sample * k).
+
+The mean over a uniform sample without replacement is reported with a normal
+confidence interval, including the finite-population correction, so a
+full-data estimate has zero width. Drawing the sample once and reusing it for
+every k keeps the comparison between k values paired.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+
+
+def sample_indices(n, size=None, seed=42):
+    """Sorted indices of a uniform sample of `size` rows (all rows if None or >= n)."""
+    if size is None or size >= n:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(seed).choice(n, size, replace=False))
+
+
+def _sq_dists(A, B):
+    d = np.einsum('ij,ij->i', A, A)[:, None] - 2.0 * A @ B.T + np.einsum('ij,ij->i', B, B)
+    return np.maximum(d, 0.0)
+
+
+def _cluster_sums(X, labels, S, k, chunks, chunk_size, block_size):
+    """Sum of distances from every row of S to the members of each cluster."""
+    sums = np.zeros((len(S), k))
+    for c in chunks:
+        start = c * chunk_size
+        chunk = np.asarray(X[start:start + chunk_size], dtype=np.float64)
+        onehot = np.zeros((len(chunk), k))
+        onehot[np.arange(len(chunk)), labels[start:start + len(chunk)]] = 1.0
+        for b in range(0, len(S), block_size):
+            sums[b:b + block_size] += np.sqrt(_sq_dists(S[b:b + block_size], chunk)) @ onehot
+    return sums
+
+
+def silhouette_values(X, labels, idx, n_clusters=None, chunk_size=4096,
+                      block_size=1024, n_jobs=1):
+    """Exact s(i) for the rows `idx` of X, streaming X in chunks."""
+    labels = np.asarray(labels)
+    k = int(labels.max()) + 1 if n_clusters is None else n_clusters
+    counts = np.bincount(labels, minlength=k)
+    S = np.asarray(X[idx], dtype=np.float64)
+    own = labels[idx]
+
+    n_chunks = math.ceil(len(X) / chunk_size)
+    n_jobs = max(1, min(n_jobs, n_chunks))
+    parts = [range(j, n_chunks, n_jobs) for j in range(n_jobs)]
+    if n_jobs == 1:
+        sums = _cluster_sums(X, labels, S, k, parts[0], chunk_size, block_size)
+    else:
+        with ThreadPoolExecutor(n_jobs) as pool:
+            sums = sum(pool.map(lambda p: _cluster_sums(X, labels, S, k, p,
+                                                        chunk_size, block_size), parts))
+
+    rows = np.arange(len(idx))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = sums[rows, own] / np.maximum(counts[own] - 1, 1)
+        mean_other = sums / counts
+    mean_other[rows, own] = np.inf
+    mean_other[:, counts == 0] = np.inf
+    b = mean_other.min(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = (b - a) / np.maximum(a, b)
+    s[counts[own] <= 1] = 0.0
+    return np.nan_to_num(s)
+
+
+def simplified_silhouette_values(X, labels, idx, centers):
+    """Centroid-based s(i) for the rows `idx` of X."""
+    S = np.asarray(X[idx], dtype=np.float64)
+    own = np.asarray(labels)[idx]
+    d = np.sqrt(_sq_dists(S, np.asarray(centers, dtype=np.float64)))
+    rows = np.arange(len(idx))
+    a = d[rows, own].copy()
+    d[rows, own] = np.inf
+    b = d.min(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = (b - a) / np.maximum(a, b)
+    return np.nan_to_num(s)
+
+
+def silhouette_estimate(X, labels, idx, method='blockwise', centers=None,
+                        confidence=0.95, **kwargs):
+    """
+    Mean silhouette over the rows `idx` of X as (estimate, lo, hi).
+
+    kwargs (chunk_size, block_size, n_jobs) are passed to silhouette_values.
+    """
+    k = None if centers is None else len(centers)
+    if method == 'simplified':
+        s = simplified_silhouette_values(X, labels, idx, centers)
+    elif method == 'blockwise':
+        s = silhouette_values(X, labels, idx, n_clusters=k, **kwargs)
+    elif method == 'sampled':
+        S = np.asarray(X[idx], dtype=np.float64)
+        s = silhouette_values(S, np.asarray(labels)[idx], np.arange(len(S)),
+                              n_clusters=k, **kwargs)
+    else:
+        raise ValueError(f"unknown silhouette method '{method}'")
+
+    n, m = len(X), len(s)
+    mean = float(s.mean())
+    if m < 2 or m >= n:
+        return mean, mean, mean
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half = z * s.std(ddof=1) / math.sqrt(m) * math.sqrt((n - m) / (n - 1))
+    return mean, mean - half, mean + half
+
+
+def score_fit(X, fit, idx, method='blockwise', confidence=0.95, **kwargs):
+    """Silhouette columns for one kmeans_sweep fit (zeros when k == 1)."""
+    labels = fit['labels']
+    if fit['k'] > 1 and np.any(labels != labels[0]):
+        sil, lo, hi = silhouette_estimate(X, labels, idx, method=method, centers=fit['centers'],
+                                          confidence=confidence, **kwargs)
+    else:
+        sil = lo = hi = 0.0
+    return {'silhouette': sil, 'silhouette_lo': float(lo), 'silhouette_hi': float(hi)}
@@ -14,6 +14,21 @@ Reads:
 Optional:
   --hops INT          : limit fire spread to this many hops from the seed set.
                         Pass -1 (or omit) for unlimited spread (default behaviour).
+  --workers INT       : split simulations over this many processes. Simulation i
+                        then draws from its own sub-stream of --base_seed, so
+                        results are identical for every worker count (but not
+                        bit-identical to the default single-stream run).
+  --adaptive          : run paired simulations in blocks until the reduction
+                        σ(∅) − σ(R) is known to within --rel_err at
+                        --confidence, or --time_budget / --max_sim is hit.
+                        --num_sim is then the minimum number of simulations.
+  --cache             : load the graph through the binary .graph_cache/ written
+                        next to the graph file (off by default).
+  --batch PATH...     : evaluate many blocked files / directories at once on
+                        shared draws; one CSV/JSON row each (--batch_out).
+                        Directories contribute the files matching
+                        --batch_pattern (default output*.txt). Not combinable
+                        with --adaptive.
 
 Budget rules:
   - Invalid edges (not in graph) and duplicates are always rejected with [ERROR].
@@ -34,18 +49,51 @@ Example:
                        --blocked_file output.txt --k 10 --num_sim 1000 --hops 3
     python evaluate.py --graph_file graph.txt --seed_file seeds.txt \
                        --blocked_file output.txt --k 10 --num_sim 1000 --hops -1
+    python evaluate.py --graph_file graph.txt --seed_file seeds.txt \
+                       --batch runs/ other/output.txt --k 10 --num_sim 1000 \
+                       --batch_out sweep.csv
+    python evaluate.py --graph_file graph.txt --seed_file seeds.txt \
+                       --blocked_file output.txt --k 10 --num_sim 200 --adaptive \
+                       --rel_err 0.01 --confidence 0.95 --time_budget 60
 """
 
+import os
+import csv
+import sys
+import json
+import time
+import math
+import fnmatch
 import random
 import argparse
+import multiprocessing as mp
+from statistics import NormalDist
 from collections import defaultdict
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np  # noqa: E402
+from graph_cache import load_edge_arrays  # noqa: E402
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 1. Loaders
 # ─────────────────────────────────────────────────────────────────────────────
 
-def load_graph(path):
+def load_graph(path, use_cache=False):
+    """
+    Load the edge list into (nodes, adj, edge_set).
+
+    By default the text file is parsed directly, warning per line. With
+    use_cache=True the edges come from the binary cache in graph_cache.py
+    (parsed once per file content, memory-mapped afterwards, written next to
+    the graph); warnings are then aggregated instead of reported per line.
+    """
+    if use_cache:
+        src, dst, prob, has_p, skipped = load_edge_arrays(path)
+        if skipped:
+            print(f"[WARN] {skipped} graph line(s) could not be parsed — skipping")
+        return _graph_from_arrays(src, dst, prob, has_p)
+
     nodes    = set()
     adj      = defaultdict(list)
     edge_set = set()
@@ -71,6 +119,26 @@ def load_graph(path):
     return nodes, dict(adj), edge_set
 
 
+def _graph_from_arrays(src, dst, prob, has_p):
+    missing = ~np.asarray(has_p, dtype=bool)
+    if missing.any():
+        print(f"[WARN] {int(missing.sum())} graph line(s) have fewer than 3 fields — skipping")
+        keep = ~missing
+        src, dst, prob = src[keep], dst[keep], prob[keep]
+    # Same test as the text path: a literal nan p is kept, with a warning.
+    bad = ~((prob > 0.0) & (prob <= 1.0))
+    if bad.any():
+        print(f"[WARN] {int(bad.sum())} edge(s) have p outside (0,1]")
+
+    nodes    = set(src.tolist()) | set(dst.tolist())
+    adj      = defaultdict(list)
+    edge_set = set()
+    for u, v, p in zip(src.tolist(), dst.tolist(), prob.tolist()):
+        adj[u].append((v, p))
+        edge_set.add((u, v))
+    return nodes, dict(adj), edge_set
+
+
 def load_seeds(path):
     seeds = set()
     with open(path, 'r') as fh:
@@ -199,21 +267,358 @@ def simulate_once(adj, source_set, blocked, rng, hops=None):
     return len(burned)
 
 
-def estimate_sigma(adj, source_set, blocked, num_sim, base_seed=42, hops=None):
+def sim_seed(base_seed, i):
+    """Seed of the sub-stream used by simulation i."""
+    return (base_seed << 32) ^ i
+
+
+# Graph state shared by pool workers (set once per process by _init_worker).
+_WORKER = {}
+
+
+def _init_worker(adj, source_set, hops):
+    _WORKER['adj']        = adj
+    _WORKER['source_set'] = source_set
+    _WORKER['hops']       = hops
+
+
+def _sigma_chunk(task):
+    start, stop, base_seed, blocked = task
+    adj, source_set, hops = _WORKER['adj'], _WORKER['source_set'], _WORKER['hops']
+    return sum(simulate_once(adj, source_set, blocked,
+                             random.Random(sim_seed(base_seed, i)), hops=hops)
+               for i in range(start, stop))
+
+
+def _many_chunk(task):
+    """Per-set spread sums, plus per-set sums of squared reductions vs. set 0."""
+    start, stop, base_seed, blocked_sets = task
+    adj, source_set, hops = _WORKER['adj'], _WORKER['source_set'], _WORKER['hops']
+    sums    = [0] * len(blocked_sets)
+    sq_diff = [0] * len(blocked_sets)
+    for i in range(start, stop):
+        res = simulate_many(adj, source_set, blocked_sets,
+                            random.Random(sim_seed(base_seed, i)), hops=hops)
+        for j, n in enumerate(res):
+            sums[j]    += n
+            sq_diff[j] += (res[0] - n) ** 2
+    return sums, sq_diff
+
+
+def _pair_chunk(task):
+    start, stop, base_seed, blocked = task
+    adj, source_set, hops = _WORKER['adj'], _WORKER['source_set'], _WORKER['hops']
+    return [simulate_pair(adj, source_set, blocked,
+                          random.Random(sim_seed(base_seed, i)), hops=hops)
+            for i in range(start, stop)]
+
+
+class SimulationPool:
+    """
+    Runs ranges of per-simulation-seeded realisations on `workers` processes.
+
+    Each range is split into about 4 chunks per worker and results are merged
+    in simulation order, so sums and running statistics do not depend on the
+    worker count. With workers=1 everything runs in-process.
+    """
+
+    def __init__(self, workers, adj, source_set, hops=None):
+        self.workers = max(1, int(workers))
+        _init_worker(adj, source_set, hops)
+        self.pool = None
+        if self.workers > 1:
+            self.pool = mp.Pool(self.workers, initializer=_init_worker,
+                                initargs=(adj, source_set, hops))
+
+    def chunks(self, start, stop):
+        size = max(1, -(-(stop - start) // (4 * self.workers)))
+        return [(a, min(a + size, stop)) for a in range(start, stop, size)]
+
+    def map(self, fn, tasks):
+        if self.pool is None:
+            return [fn(t) for t in tasks]
+        return self.pool.map(fn, tasks)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def estimate_sigma(adj, source_set, blocked, num_sim, base_seed=42, hops=None,
+                   sim_pool=None):
     """
     Monte-Carlo estimate of σ(blocked) = E[|A_∞|] over `num_sim` realisations.
 
     Parameters
     ----------
-    hops : passed through to simulate_once; limits spread to this many hops
-           from the seed set. None means unlimited spread.
+    hops     : passed through to simulate_once; limits spread to this many hops
+               from the seed set. None means unlimited spread.
+    sim_pool : optional SimulationPool. When given, simulation i uses its own
+               sub-stream sim_seed(base_seed, i) and runs on the pool; otherwise
+               all simulations share one stream seeded with base_seed.
     """
+    if sim_pool is not None:
+        tasks = [(a, b, base_seed, blocked) for a, b in sim_pool.chunks(0, num_sim)]
+        return sum(sim_pool.map(_sigma_chunk, tasks)) / num_sim
+
     rng     = random.Random(base_seed)
     results = [simulate_once(adj, source_set, blocked, rng, hops=hops)
                for _ in range(num_sim)]
     return sum(results) / num_sim
 
 
+def simulate_many(adj, source_set, blocked_sets, rng, hops=None):
+    """
+    One realisation evaluated under several blocked sets, on the SAME world.
+
+    Each edge's coin is drawn from `rng` the first time any run needs it and
+    reused by the later runs, so all spreads see identical live edges (common
+    random numbers). Differences between blocked sets are therefore far less
+    noisy than differences of independent estimates.
+
+    Returns [|A_∞| for each set in `blocked_sets`], in order.
+    """
+    coins = {}
+
+    def spread(blk):
+        burned = set(source_set)
+        frontier = [(node, 0) for node in source_set]
+        while frontier:
+            next_frontier = []
+            for u, depth in frontier:
+                if hops is not None and depth >= hops:
+                    continue
+                for (v, p) in adj.get(u, ()):
+                    if (u, v) in blk or v in burned:
+                        continue
+                    live = coins.get((u, v))
+                    if live is None:
+                        live = rng.random() < p
+                        coins[(u, v)] = live
+                    if live:
+                        burned.add(v)
+                        next_frontier.append((v, depth + 1))
+            frontier = next_frontier
+        return len(burned)
+
+    return [spread(blk) for blk in blocked_sets]
+
+
+def simulate_pair(adj, source_set, blocked, rng, hops=None):
+    """
+    One paired realisation: |A_∞| without and with `blocked`, on the SAME world.
+
+    Returns (burned_empty, burned_blocked); see simulate_many.
+    """
+    a, b = simulate_many(adj, source_set, (frozenset(), blocked), rng, hops=hops)
+    return a, b
+
+
+class RunningStats:
+    """Welford accumulator for a running mean / sample variance."""
+
+    def __init__(self):
+        self.n    = 0
+        self.mean = 0.0
+        self.m2   = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float('inf')
+
+    def half_width(self, z):
+        """Half-width of the normal-approximation interval at quantile z."""
+        if self.n < 2:
+            return float('inf')
+        return z * math.sqrt(self.variance / self.n)
+
+
+def estimate_sigma_adaptive(adj, source_set, blocked, min_sim, max_sim,
+                            block_size, rel_err, confidence, time_budget=None,
+                            base_seed=42, hops=None, sim_pool=None):
+    """
+    Paired Monte-Carlo estimate of σ(∅) and σ(R), sampled in blocks.
+
+    Simulation i uses its own RNG seeded with sim_seed(base_seed, i), so results
+    are reproducible and the same worlds are replayed whatever the stopping
+    point or the number of workers in `sim_pool` (in-process if None).
+    After each block of `block_size` simulations (and at least `min_sim`) the
+    loop stops once the half-width of the `confidence` interval on the mean
+    reduction σ(∅) − σ(R) is at most `rel_err` times that mean, or when
+    `max_sim` simulations or `time_budget` seconds have been spent.
+
+    Returns a dict with mu0, muR, reduction, its half-width, num_sim and the
+    reason the loop stopped ("converged", "max_sim" or "time_budget").
+    """
+    z     = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    s0    = RunningStats()
+    sR    = RunningStats()
+    diff  = RunningStats()
+    t0    = time.perf_counter()
+    i     = 0
+    reason = "max_sim"
+
+    own_pool = sim_pool is None
+    if own_pool:
+        sim_pool = SimulationPool(1, adj, source_set, hops)
+
+    while i < max_sim:
+        stop  = min(i + block_size, max_sim)
+        tasks = [(a, b, base_seed, blocked) for a, b in sim_pool.chunks(i, stop)]
+        for chunk in sim_pool.map(_pair_chunk, tasks):
+            for a, b in chunk:
+                s0.add(a); sR.add(b); diff.add(a - b)
+        i = stop
+        if i < min_sim:
+            continue
+        hw = diff.half_width(z)
+        if hw <= rel_err * abs(diff.mean):
+            reason = "converged"
+            break
+        if time_budget is not None and time.perf_counter() - t0 >= time_budget:
+            reason = "time_budget"
+            break
+
+    if own_pool:
+        sim_pool.close()
+
+    return {
+        "mu0":        s0.mean,
+        "muR":        sR.mean,
+        "reduction":  diff.mean,
+        "half_width": diff.half_width(z),
+        "num_sim":    i,
+        "reason":     reason,
+    }
+
+
+def estimate_sigma_batch(adj, source_set, blocked_sets, num_sim, base_seed=42,
+                         hops=None, sim_pool=None):
+    """
+    σ(∅) and σ(R) for many blocked sets from one shared set of realisations.
+
+    Every simulation replays one world (sub-stream sim_seed(base_seed, i)) for
+    the empty set and all `blocked_sets` via simulate_many, so σ(∅) is computed
+    once and all sets are compared on common random numbers.
+
+    Returns (mu0, [muR per set], [std. error of σ(∅) − σ(R) per set]).
+    """
+    sets = [frozenset()] + list(blocked_sets)
+    if sim_pool is None:
+        sim_pool = SimulationPool(1, adj, source_set, hops)
+    tasks = [(a, b, base_seed, sets) for a, b in sim_pool.chunks(0, num_sim)]
+
+    sums    = [0] * len(sets)
+    sq_diff = [0] * len(sets)
+    for chunk_sums, chunk_sq in sim_pool.map(_many_chunk, tasks):
+        for j in range(len(sets)):
+            sums[j]    += chunk_sums[j]
+            sq_diff[j] += chunk_sq[j]
+
+    means = [x / num_sim for x in sums]
+    stderr = []
+    for j in range(1, len(sets)):
+        d = means[0] - means[j]
+        var = (sq_diff[j] - num_sim * d * d) / max(num_sim - 1, 1)
+        stderr.append(math.sqrt(max(var, 0.0) / num_sim))
+    return means[0], means[1:], stderr
+
+
+def expand_batch_paths(paths, pattern='output*.txt', exclude=()):
+    """
+    Blocked files from a mix of files and directories. Files are kept as
+    given; directories contribute their files matching `pattern` (sorted),
+    except those in `exclude` (the graph and seed files).
+    """
+    skip = {os.path.realpath(p) for p in exclude if p}
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, f) for f in os.listdir(path)
+                if fnmatch.fnmatch(f, pattern)
+                and os.path.isfile(os.path.join(path, f))
+                and os.path.realpath(os.path.join(path, f)) not in skip))
+        else:
+            files.append(path)
+    return files
+
+
+def run_batch(args, adj, edge_set, source_set, hops, hops_str, sim_pool=None):
+    """Evaluate every blocked file in args.batch and write one row per file."""
+    files = expand_batch_paths(args.batch, args.batch_pattern,
+                               exclude=(args.graph_file, args.seed_file))
+    if not files:
+        raise ValueError("Batch mode found no blocked files.")
+
+    rows, blocked_sets = [], []
+    for path in files:
+        print(f"\n  --- {path}")
+        blocked, n_valid_total, over_budget, under_budget = load_blocked(
+            path, edge_set, args.k)
+        blocked_sets.append(blocked)
+        rows.append({
+            "blocked_file":    path,
+            "valid_edges":     n_valid_total,
+            "edges_evaluated": len(blocked),
+            "over_budget":     over_budget,
+            "under_budget":    under_budget,
+        })
+
+    print(f"\n  Computing σ(∅) and σ(R) for {len(files)} file(s) on shared draws ...",
+          flush=True)
+    mu0, muRs, stderrs = estimate_sigma_batch(
+        adj, source_set, blocked_sets, args.num_sim, args.base_seed,
+        hops=hops, sim_pool=sim_pool)
+
+    for row, muR, se in zip(rows, muRs, stderrs):
+        reduction = mu0 - muR
+        row.update({
+            "sigma_empty":      round(mu0, 4),
+            "sigma_R":          round(muR, 4),
+            "reduction":        round(reduction, 4),
+            "reduction_stderr": round(se, 4),
+            "rho_R":            round(reduction / max(mu0, 1e-9), 6),
+            "k":                args.k,
+            "num_sim":          args.num_sim,
+            "hops":             hops_str,
+        })
+
+    out = args.batch_out
+    if out.endswith('.json'):
+        with open(out, 'w') as fh:
+            json.dump(rows, fh, indent=2)
+    else:
+        with open(out, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    print()
+    print("=" * 65)
+    print(f"  BATCH RESULTS  (σ(∅) = {mu0:.4f})")
+    print("=" * 65)
+    for row in rows:
+        print(f"  ρ(R)={row['rho_R']:.6f}  σ(R)={row['sigma_R']:>10.4f}"
+              f"  ±{row['reduction_stderr']:.4f}  {row['blocked_file']}")
+    print("=" * 65)
+    print(f"  Wrote {len(rows)} row(s) to {out}")
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 3. Main
 # ─────────────────────────────────────────────────────────────────────────────
@@ -224,15 +629,49 @@ def main():
     parser.add_argument('--graph_file')
     parser.add_argument('--seed_file')
     parser.add_argument('--blocked_file')
+    parser.add_argument(
+        '--batch', nargs='+', default=None, metavar='PATH',
+        help="Evaluate many blocked files (or directories of them) in one run: "
+             "the graph is loaded and σ(∅) computed once, all files share draws."
+    )
+    parser.add_argument('--batch_pattern', default='output*.txt',
+                        help="Which files of a --batch directory to evaluate (glob).")
+    parser.add_argument('--batch_out', default='batch_results.csv',
+                        help="Batch output, CSV or JSON by extension.")
     parser.add_argument('--k',       type=int)
     parser.add_argument('--num_sim', type=int)
     parser.add_argument('--base_seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Run simulations on this many processes, each simulation "
+                             "on its own sub-stream of --base_seed (worker-count "
+                             "independent results).")
+    parser.add_argument('--cache', action='store_true',
+                        help="Load the graph through the binary cache (.graph_cache/ next to "
+                             "the graph file) instead of parsing the text file.")
+    parser.add_argument(
+        '--adaptive', action='store_true',
+        help="Sample paired simulations in blocks until the reduction is known "
+             "to --rel_err at --confidence. --num_sim becomes the minimum."
+    )
+    parser.add_argument('--rel_err',     type=float, default=0.01,
+                        help="Target relative half-width of the reduction CI (adaptive).")
+    parser.add_argument('--confidence',  type=float, default=0.95,
+                        help="Confidence level of the reported interval (adaptive).")
+    parser.add_argument('--block_size',  type=int,   default=100,
+                        help="Simulations per block between stopping checks (adaptive).")
+    parser.add_argument('--max_sim',     type=int,   default=100_000,
+                        help="Hard cap on simulations (adaptive).")
+    parser.add_argument('--time_budget', type=float, default=None,
+                        help="Stop sampling after this many seconds (adaptive).")
     parser.add_argument(
         '--hops', type=int, default=-1,
         help="Limit fire spread to this many hops from the seed set. "
              "-1 (default) means unlimited spread."
     )
     args = parser.parse_args()
+    if args.batch and args.adaptive:
+        parser.error("--adaptive cannot be combined with --batch "
+                     "(batch files share one fixed set of --num_sim draws)")
 
     # Normalise: -1 sentinel → None (unlimited)
     hops     = None if args.hops < 0 else args.hops
@@ -243,15 +682,29 @@ def main():
     print("=" * 65)
     print(f"  Graph        : {args.graph_file}")
     print(f"  Seed file    : {args.seed_file}")
-    print(f"  Blocked file : {args.blocked_file}")
+    if args.batch:
+        print(f"  Batch        : {' '.join(args.batch)}")
+    else:
+        print(f"  Blocked file : {args.blocked_file}")
     print(f"  k (budget)   : {args.k}")
     print(f"  Simulations  : {args.num_sim}")
     print(f"  Base seed    : {args.base_seed}")
     print(f"  Hops         : {hops_str}")
+    if args.workers is not None:
+        print(f"  Workers      : {args.workers}")
     print("=" * 65)
 
-    nodes, adj, edge_set = load_graph(args.graph_file)
+    nodes, adj, edge_set = load_graph(args.graph_file, use_cache=args.cache)
     source_set           = load_seeds(args.seed_file)
+
+    if args.batch:
+        sim_pool = SimulationPool(args.workers or 1, adj, source_set, hops)
+        try:
+            run_batch(args, adj, edge_set, source_set, hops, hops_str, sim_pool)
+        finally:
+            sim_pool.close()
+        return
+
     blocked, n_valid_total, over_budget, under_budget = load_blocked(
         args.blocked_file, edge_set, args.k)
 
@@ -269,13 +722,34 @@ def main():
     print(f"  Valid edges in file: {n_valid_total}  (budget k={args.k})")
     print(f"  Edges used for σ(R): {len(blocked)}")
 
-    print(f"\n  Computing σ(∅)  (baseline, no edges blocked) ...", flush=True)
-    mu0 = estimate_sigma(adj, source_set, frozenset(), args.num_sim, args.base_seed,
-                         hops=hops)
+    sim_pool = None
+    if args.workers is not None:
+        sim_pool = SimulationPool(args.workers, adj, source_set, hops)
+
+    adaptive = None
+    if args.adaptive:
+        print(f"\n  Computing σ(∅) and σ(R)  (paired, adaptive: rel_err={args.rel_err}, "
+              f"confidence={args.confidence}) ...", flush=True)
+        adaptive = estimate_sigma_adaptive(
+            adj, source_set, blocked,
+            min_sim=args.num_sim, max_sim=max(args.num_sim, args.max_sim),
+            block_size=max(1, args.block_size), rel_err=args.rel_err,
+            confidence=args.confidence, time_budget=args.time_budget,
+            base_seed=args.base_seed, hops=hops, sim_pool=sim_pool)
+        mu0, muR = adaptive["mu0"], adaptive["muR"]
+        num_sim  = adaptive["num_sim"]
+    else:
+        print(f"\n  Computing σ(∅)  (baseline, no edges blocked) ...", flush=True)
+        mu0 = estimate_sigma(adj, source_set, frozenset(), args.num_sim, args.base_seed,
+                             hops=hops, sim_pool=sim_pool)
+
+        print(f"  Computing σ(R)  (with {len(blocked)} blocked edges) ...", flush=True)
+        muR = estimate_sigma(adj, source_set, blocked, args.num_sim, args.base_seed,
+                             hops=hops, sim_pool=sim_pool)
+        num_sim = args.num_sim
 
-    print(f"  Computing σ(R)  (with {len(blocked)} blocked edges) ...", flush=True)
-    muR = estimate_sigma(adj, source_set, blocked, args.num_sim, args.base_seed,
-                         hops=hops)
+    if sim_pool is not None:
+        sim_pool.close()
 
     reduction     = mu0 - muR
     reduction_pct = 100.0 * reduction / max(mu0, 1e-9)
@@ -290,6 +764,11 @@ def main():
     print(f"  |R| evaluated  = {len(blocked)}  (budget k={args.k})")
     print(f"  Reduction      = {reduction:>8.4f}  ({reduction_pct:.2f}%)")
     print(f"  ρ(R)           = {rho_R:.6f}")
+    if adaptive is not None:
+        hw = adaptive["half_width"]
+        print(f"  Reduction CI   = [{reduction - hw:.4f}, {reduction + hw:.4f}]"
+              f"  ({100 * args.confidence:g}% confidence)")
+        print(f"  Simulations    = {num_sim}  (stopped: {adaptive['reason']})")
     print(f"  Hops           = {hops_str}")
     print("=" * 65)
 
@@ -303,9 +782,14 @@ def main():
         print(f"            Blocking {args.k - n_valid_total} more edge(s) could improve ρ(R).")
 
     # Machine-readable summary line
-    print(f"\nSUMMARY  sigma_empty={mu0:.4f}  sigma_R={muR:.4f}  rho_R={rho_R:.6f}"
-          f"  edges_evaluated={len(blocked)}  k={args.k}  num_sim={args.num_sim}"
-          f"  hops={hops_str}")
+    summary = (f"\nSUMMARY  sigma_empty={mu0:.4f}  sigma_R={muR:.4f}  rho_R={rho_R:.6f}"
+               f"  edges_evaluated={len(blocked)}  k={args.k}  num_sim={num_sim}"
+               f"  hops={hops_str}")
+    if adaptive is not None:
+        hw = adaptive["half_width"]
+        summary += (f"  reduction_lo={reduction - hw:.4f}  reduction_hi={reduction + hw:.4f}"
+                    f"  confidence={args.confidence:g}  stop={adaptive['reason']}")
+    print(summary)
 
 
 if __name__ == "__main__":
@@ -1,33 +1,40 @@
+import os
 import sys
+import math
 import time
+import argparse
 import heapq
 import random
 from collections import defaultdict
 
+import numpy as np
+
+from rr_sets import RRIndex
+from checkpoint import save_checkpoint, load_checkpoint
+from graph_cache import file_digest, load_edge_arrays, sample_live_masks
+from budget import Budget
+from sketch_greedy import sketch_gains, stochastic_shortlist
+from profiler import PROFILE
+
+
+def read_graph(graph_file, r, seed=42, digest=None):
+    # Edge arrays come from the binary cache (parsed once per graph file) and
+    # all r live-edge coins are drawn in one vectorised pass.
+    src, dst, prob, _has_p, skipped = load_edge_arrays(graph_file, digest=digest)
+    if skipped:
+        print(f"Warning: skipped {skipped} unparseable line(s) in {graph_file}")
+    prob = np.nan_to_num(prob, nan=1.0)
+    masks = sample_live_masks(prob, r, np.random.default_rng(seed))
 
-def read_graph(graph_file, r):
     adj = defaultdict(list)
     edges_list = []
-    with open(graph_file, 'r') as f:
-        for line in f:
-            parts = line.strip().split()
-            if not parts: 
-                continue
-
-            if len(parts) >= 3:
-                u, v, p = int(parts[0]), int(parts[1]), float(parts[2])
-            else:
-                u, v = int(parts[0]), int(parts[1])
-                p = 1.0
-                
-            mask = 0
-            for i in range(r):
-                if random.random() < p:
-                    mask |= (1 << i)
-            if mask > 0:
-                adj[u].append((v, mask))
-                edges_list.append((u, v, mask))
-    return adj, edges_list
+    weighted_edges = []
+    for u, v, p, mask in zip(src.tolist(), dst.tolist(), prob.tolist(), masks):
+        weighted_edges.append((u, v, p))
+        if mask > 0:
+            adj[u].append((v, mask))
+            edges_list.append((u, v, mask))
+    return adj, edges_list, weighted_edges
 
 def write_output(output_lines=None, out_file=None, k=None):
     # Write only the edges actually selected so far.
@@ -40,6 +47,7 @@ def write_output(output_lines=None, out_file=None, k=None):
 
 def get_h_hop_reachability(r, A0, hops, adj, blocked, return_edges=False):
     total_reach = 0
+    relaxed = 0
     candidate_edges = set()
     for i in range(r):
         visited = set(A0)
@@ -53,6 +61,7 @@ def get_h_hop_reachability(r, A0, hops, adj, blocked, return_edges=False):
             if d == hops:
                 continue
             if u in adj:
+                relaxed += len(adj[u])
                 for v, mask in adj[u]:
                     if (mask & (1 << i)):
                         if (u, v) not in blocked:
@@ -63,10 +72,14 @@ def get_h_hop_reachability(r, A0, hops, adj, blocked, return_edges=False):
                                 depths[v] = d + 1
                                 q.append(v)
         total_reach += len(visited)
+    PROFILE.count('reachability_calls')
+    PROFILE.count('bfs_runs', r)
+    PROFILE.count('edges_relaxed', relaxed)
     return total_reach, candidate_edges
 
 def compute_dominator_gains(A0, adj, super_root, A0_set, r, blocked):
     marginal_gains = defaultdict(int)
+    relaxed = 0
     for i in range(r):
         local_adj = defaultdict(list)
         local_rev = defaultdict(list)
@@ -78,6 +91,7 @@ def compute_dominator_gains(A0, adj, super_root, A0_set, r, blocked):
             u = q[q_idx]
             q_idx += 1
             if u in adj:
+                relaxed += len(adj[u])
                 for v, mask in adj[u]:
                     if (mask & (1 << i)) and (u, v) not in blocked:
                         local_adj[u].append(v)
@@ -188,50 +202,112 @@ def compute_dominator_gains(A0, adj, super_root, A0_set, r, blocked):
             
             if is_bridge:
                 marginal_gains[(idom_v, v)] += subtree_size[v]
-                
+
+    PROFILE.count('dominator_passes')
+    PROFILE.count('bfs_runs', r)
+    PROFILE.count('edges_relaxed', relaxed)
     return marginal_gains
 
-def generate_rr_scores(adj, rev_graph, num_samples=400):
-    edge_score = defaultdict(int)
-    nodes = list({u for u in adj} | {v for u in adj for v, _ in adj[u]})
+def build_rr_index(weighted_edges, A0, hops, num_samples=20000, deadline=None):
+    with PROFILE.phase('rr_index'):
+        rr_index = RRIndex(weighted_edges, A0, hops)
+        rr_index.sample(num_samples, random, deadline=deadline)
+    PROFILE.count('rr_samples', rr_index.num_samples)
+    PROFILE.count('rr_set_entries', len(rr_index.items))
+    return rr_index
 
-    for _ in range(num_samples):
-        v = random.choice(nodes)
+def rr_fill(rr_index, weighted_edges, A0, hops, blocked_edges, output_lines, k, deadline):
+    # Cheap fallback near the deadline: complete the output with RR
+    # max-coverage picks instead of exact marginal gains. The index (built
+    # here if missing) first gets more samples until `deadline`, since the
+    # one built at startup may hold very few. If coverage still runs out,
+    # pad with unblocked graph edges whose target has the most out-edges,
+    # so k lines are written whenever the graph has k edges.
+    # Returns (rr_index, number of padded edges).
+    if rr_index is None:
+        rr_index = build_rr_index(weighted_edges, A0, hops, deadline=deadline)
+    else:
+        before = rr_index.num_samples
+        with PROFILE.phase('rr_index'):
+            rr_index.sample(20000, random, deadline=deadline)
+        PROFILE.count('rr_samples', rr_index.num_samples - before)
 
-        visited = {v}
-        stack = [v]
+    padded = 0
+    with PROFILE.phase('rr_fill'):
+        for e, _ in rr_index.greedy(k - len(output_lines), blocked=blocked_edges):
+            if e not in blocked_edges:
+                blocked_edges.add(e)
+                output_lines.append(e)
+                PROFILE.count('rr_fill_edges')
+        if len(output_lines) < k:
+            out_degree = defaultdict(int)
+            for u, _, _ in weighted_edges:
+                out_degree[u] += 1
+            for u, v, _ in sorted(weighted_edges, key=lambda e: -out_degree[e[1]]):
+                if len(output_lines) >= k:
+                    break
+                if (u, v) not in blocked_edges:
+                    blocked_edges.add((u, v))
+                    output_lines.append((u, v))
+                    padded += 1
+            PROFILE.count('padded_edges', padded)
+    return rr_index, padded
 
-        while stack:
-            x = stack.pop()
-            for u, mask in rev_graph.get(x, []):
-                if u not in visited:
-                    visited.add(u)
-                    stack.append(u)
-                    edge_score[(u, x)] += 1
-    return edge_score
-
-def build_reverse_graph(adj):
-    rev = defaultdict(list)
-    for u in adj:
-        for v, mask in adj[u]:
-            rev[v].append((u, mask))
-    return rev
+def parse_args():
+    parser = argparse.ArgumentParser(
+        usage="python3 Q2.py <graph> <seed> <out> <k> <r> <hops> "
+              "[--mode celf|sketch] [--time_limit SECS] [--checkpoint [PATH]] "
+              "[--checkpoint_interval SECS] [--resume] [--profile JSON]")
+    parser.add_argument('graph_file')
+    parser.add_argument('seed_file')
+    parser.add_argument('out_file')
+    parser.add_argument('k', type=int)
+    parser.add_argument('r', type=int)
+    parser.add_argument('hops', type=int)
+    parser.add_argument('--mode', choices=('celf', 'sketch'), default='celf',
+                        help="celf: exact CELF / dominator gains (default); sketch: "
+                             "stochastic greedy over bottom-k sketch estimates")
+    parser.add_argument('--epsilon', type=float, default=0.1,
+                        help="Stochastic-greedy subsample parameter (sketch mode)")
+    parser.add_argument('--sketch_k', type=int, default=32,
+                        help="Bottom-k sketch size (sketch mode)")
+    parser.add_argument('--verify', type=int, default=3,
+                        help="Shortlisted edges verified exactly per step (sketch mode)")
+    parser.add_argument('--time_limit', type=float, default=55 * 60,
+                        help="Wall-clock budget in seconds (default: 55 min)")
+    parser.add_argument('--checkpoint', nargs='?', const='', default=None, metavar='PATH',
+                        help="Write checkpoints, to PATH if given (default: <out>.ckpt)")
+    parser.add_argument('--checkpoint_interval', type=float, default=60.0,
+                        help="Seconds between checkpoints (0: after every step)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue from the checkpoint (and keep writing it); "
+                             "k may be larger than before")
+    parser.add_argument('--profile', default=None, metavar='JSON',
+                        help="Write phase timers and work counters to this JSON file")
+    return parser.parse_args()
 
 def main():
-    if len(sys.argv) < 7:
-        print("Usage: python3 Q2.py <graph> <seed> <out> <k> <r> <hops>")
-        sys.exit(1)
-        
-    random.seed(42)
+    args = parse_args()
+
+    SEED = 42
+    random.seed(SEED)
     start_time = time.time()
-    TIME_LIMIT = 55 * 60
-
-    graph_file = sys.argv[1]
-    seed_file = sys.argv[2]
-    out_file = sys.argv[3]
-    k = int(sys.argv[4])
-    r = int(sys.argv[5])
-    hops = int(sys.argv[6])
+    budget = Budget(args.time_limit, start=start_time)
+    MIN_R = 10
+    REFRESH_INTERVAL = 10
+
+    graph_file = args.graph_file
+    seed_file = args.seed_file
+    out_file = args.out_file
+    k = args.k
+    r = args.r
+    hops = args.hops
+    # Checkpoints are written only when asked for (--checkpoint or --resume).
+    ckpt_file = args.checkpoint or out_file + '.ckpt'
+    checkpointing = args.checkpoint is not None or args.resume
+    # Each branch below keeps different state in the checkpoint.
+    mode = args.mode if args.mode == 'sketch' else ('celf' if hops != -1 else 'dominator')
+    graph_digest = file_digest(graph_file)
     
     # Seed nodes
     A0 = []
@@ -242,78 +318,211 @@ def main():
     A0 = list(set(A0))
 
     # Graph input
-    adj, edges_list = read_graph(graph_file, r)
-    adj = {u: adj[u] for u in adj}
+    with PROFILE.phase('graph_load'):
+        adj, edges_list, weighted_edges = read_graph(graph_file, r, SEED, graph_digest)
+        adj = {u: adj[u] for u in adj}
 
-    # Build reverse graph
-    rev_graph = build_reverse_graph(adj)
-    rr_scores = generate_rr_scores(adj, rev_graph)
-    
     # Initialize blocked edges and output lines
     blocked_edges = set()
     output_lines = []
+    resumed = None
+    if args.resume and os.path.exists(ckpt_file):
+        try:
+            resumed = load_checkpoint(ckpt_file)
+        except (OSError, ValueError) as e:
+            print(f"Cannot resume from {ckpt_file}: {e}")
+            sys.exit(1)
+        if (resumed['seed'], resumed['r'], resumed['hops'], resumed['graph_digest']) != \
+                (SEED, r, hops, graph_digest):
+            print(f"Checkpoint {ckpt_file} was written for a different graph, r or hops")
+            sys.exit(1)
+        if resumed['mode'] != mode:
+            print(f"Checkpoint {ckpt_file} was written in {resumed['mode']} mode, not {mode}")
+            sys.exit(1)
+        output_lines = resumed['blocked_order']
+        blocked_edges = set(output_lines)
     write_output(output_lines, out_file, k)
     valid_edges = {(u, v) for u, v, _ in edges_list}
+
+    # r_eff <= r is the number of sampled worlds gains are evaluated on; the
+    # budget lowers it when all r worlds would not fit in the time limit.
+    r_eff = resumed['r_eff'] if resumed is not None else r
+    rr_index = None
+    # Edges chosen exactly before the budget forced the RR fallback, if it did.
+    degraded = None
+    padded = 0
+    last_ckpt = time.time()
+
+    def rr_window():
+        # Time the RR fallback may spend sampling.
+        return min(0.5 * budget.remaining(), 0.1 * args.time_limit)
+
+    def checkpoint(celf_queue=(), seen_candidates=(), force=False):
+        nonlocal last_ckpt
+        if not checkpointing:
+            return
+        if force or time.time() - last_ckpt >= args.checkpoint_interval:
+            with PROFILE.phase('checkpoint'):
+                save_checkpoint(ckpt_file, SEED, r, hops, graph_digest, output_lines,
+                                celf_queue, seen_candidates, r_eff=r_eff, mode=mode)
+            last_ckpt = time.time()
     
-    if hops != -1:
+    if args.mode == 'sketch':
+        # Stochastic greedy: each step screens a random subsample of the
+        # frontier edges with sketch estimates and verifies the best few.
+        current_reach, _ = get_h_hop_reachability(r_eff, A0, hops, adj, blocked_edges)
+
+        for step in range(len(output_lines), k):
+            if budget.usable() < budget.cost('step', 0.0):
+                break
+            best_edge, best_gain = None, 0
+            with budget.measure('step'):
+                with PROFILE.phase('sketch_screen'):
+                    gains = sketch_gains(r_eff, A0, hops, adj, blocked_edges,
+                                         sketch_k=args.sketch_k, salt=step)
+                PROFILE.count('sketch_candidates', len(gains))
+                if gains:
+                    shortlist = stochastic_shortlist(gains, k, args.epsilon, args.verify)
+                    for e in shortlist:
+                        PROFILE.count('sketch_verifications')
+                        blocked_edges.add(e)
+                        new_r, _ = get_h_hop_reachability(r_eff, A0, hops, adj, blocked_edges)
+                        blocked_edges.remove(e)
+                        if current_reach - new_r > best_gain:
+                            best_edge, best_gain = e, current_reach - new_r
+            if best_edge is None:
+                break
+
+            blocked_edges.add(best_edge)
+            current_reach -= best_gain
+            output_lines.append(best_edge)
+            write_output(output_lines, out_file, k)
+            checkpoint()
+
+        if len(output_lines) < k:
+            rr_index, padded = rr_fill(rr_index, weighted_edges, A0, hops, blocked_edges,
+                                       output_lines, k, time.time() + rr_window())
+            write_output(output_lines, out_file, k)
+
+        checkpoint(force=True)
+
+    elif hops != -1:
         
-        candidate_limit = max(10 * k, int(0.01 * len(edges_list)))
-        top_rr = heapq.nlargest(candidate_limit, rr_scores.items(), key=lambda x: x[1])
-        rr_candidates = {
-            e for e, _ in top_rr if e in valid_edges
-        }
-        current_reach, candidates = get_h_hop_reachability(r, A0, hops, adj, blocked_edges, return_edges=True)
-        candidates = candidates | rr_candidates
-
-        celf_queue = []
-        seen_candidates = set()
-
-        for e in candidates:
-            if e in seen_candidates:
-                continue
-            seen_candidates.add(e)
+        with budget.measure('probe'):
+            current_reach, candidates = get_h_hop_reachability(r_eff, A0, hops, adj, blocked_edges, return_edges=True)
 
-            blocked_edges.add(e)
-            new_reach, _ = get_h_hop_reachability(r, A0, hops, adj, blocked_edges)
-            blocked_edges.remove(e)
+        if resumed is not None:
+            celf_queue = resumed['celf_queue']
+            seen_candidates = resumed['seen_candidates']
+        else:
+            candidate_limit = max(10 * k, int(0.01 * len(edges_list)))
+            rr_index = build_rr_index(weighted_edges, A0, hops,
+                                      deadline=time.time() + 0.1 * budget.usable())
+            rr_candidates = {
+                e for e, _ in rr_index.greedy(candidate_limit) if e in valid_edges
+            }
+            candidates = candidates | rr_candidates
 
-            gain = current_reach - new_reach
-            if gain > 0:
-                celf_queue.append((-gain, e))
+            # Plan for the initial pass plus ~3 re-evaluations per step to use
+            # at most half of the usable time: first trade worlds for speed,
+            # then trim the pool to the candidates with the best RR coverage.
+            planned = (len(candidates) + 3 * k) * budget.cost('probe')
+            if planned > 0.5 * budget.usable() and r > MIN_R:
+                r_new = max(MIN_R, int(r * 0.5 * budget.usable() / planned))
+                budget.scale('probe', r_new / r_eff)
+                r_eff = r_new
+                current_reach, _ = get_h_hop_reachability(r_eff, A0, hops, adj, blocked_edges)
+            max_pool = budget.affordable('probe', 0.4)
+            if len(candidates) > max_pool:
+                scores = rr_index.edge_scores()
+                candidates = sorted(candidates, key=lambda e: (-scores.get(e, 0), e))[:max_pool]
 
-        heapq.heapify(celf_queue)
-        REFRESH_INTERVAL = 10
+            # Heap entries are (-gain, edge, step the gain was computed at).
+            celf_queue = []
+            seen_candidates = set()
 
-        for step in range(k):
-            best_edge = None
-            
-            if time.time() - start_time > TIME_LIMIT:
-                break
-            
-            if step % REFRESH_INTERVAL == 0:
-                _, new_candidates = get_h_hop_reachability(
-                    r, A0, hops, adj, blocked_edges, return_edges=True
-                )
-                for e in new_candidates:
-                    if e in seen_candidates or e in blocked_edges:
+            with PROFILE.phase('initial_pass'):
+                for e in candidates:
+                    if budget.expired():
+                        break
+                    if e in seen_candidates:
                         continue
                     seen_candidates.add(e)
 
                     blocked_edges.add(e)
-                    new_reach, _ = get_h_hop_reachability(
-                        r, A0, hops, adj, blocked_edges
-                    )
+                    with budget.measure('probe'):
+                        new_reach, _ = get_h_hop_reachability(r_eff, A0, hops, adj, blocked_edges)
                     blocked_edges.remove(e)
+                    PROFILE.count('initial_probes')
+
                     gain = current_reach - new_reach
                     if gain > 0:
-                        heapq.heappush(celf_queue, (-gain, e))
+                        celf_queue.append((-gain, e, 0))
+
+                heapq.heapify(celf_queue)
+            checkpoint(celf_queue, seen_candidates, force=True)
+
+        refresh_interval = REFRESH_INTERVAL
+        next_refresh = -(-len(output_lines) // REFRESH_INTERVAL) * REFRESH_INTERVAL
+
+        for step in range(len(output_lines), k):
+            best_edge = None
+            
+            # Degrade to RR-based selection once an exact step no longer fits.
+            if budget.usable() < budget.cost('step', 0.0):
+                degraded = len(output_lines)
+                break
+            t_step = time.time()
+            
+            if step >= next_refresh:
+                with budget.measure('refresh'), PROFILE.phase('refresh'):
+                    _, new_candidates = get_h_hop_reachability(
+                        r_eff, A0, hops, adj, blocked_edges, return_edges=True
+                    )
+                    for e in new_candidates:
+                        if budget.expired():
+                            break
+                        if e in seen_candidates or e in blocked_edges:
+                            continue
+                        seen_candidates.add(e)
+
+                        blocked_edges.add(e)
+                        with budget.measure('probe'):
+                            new_reach, _ = get_h_hop_reachability(
+                                r_eff, A0, hops, adj, blocked_edges
+                            )
+                        blocked_edges.remove(e)
+                        PROFILE.count('refresh_probes')
+                        gain = current_reach - new_reach
+                        if gain > 0:
+                            heapq.heappush(celf_queue, (-gain, e, step))
+
+                # Refresh less often when it would take more than a fifth of
+                # the time each remaining step can still have.
+                share = budget.usable() / (k - step)
+                refresh_interval = max(REFRESH_INTERVAL, math.ceil(
+                    budget.cost('refresh') / max(0.2 * share, 1e-9)))
+                next_refresh = step + refresh_interval
                     
             while celf_queue:
-                neg_gain, e = heapq.heappop(celf_queue)
+                if budget.expired():
+                    degraded = len(output_lines)
+                    break
+                neg_gain, e, stamp = heapq.heappop(celf_queue)
+                PROFILE.count('celf_heap_pops')
+
+                # A gain computed at this step is exact: no need to re-evaluate.
+                if stamp == step:
+                    PROFILE.count('celf_fresh_hits')
+                    best_edge = e
+                    current_reach += neg_gain
+                    break
                 
                 blocked_edges.add(e)
-                new_r, _ = get_h_hop_reachability(r, A0, hops, adj, blocked_edges)
+                with budget.measure('probe'), PROFILE.phase('celf_reevaluate'):
+                    new_r, _ = get_h_hop_reachability(r_eff, A0, hops, adj, blocked_edges)
                 blocked_edges.remove(e)
+                PROFILE.count('celf_reevaluations')
                 
                 actual_gain = current_reach - new_r
                 if actual_gain <= 0:
@@ -324,24 +533,45 @@ def main():
                     current_reach = new_r
                     break
                 else:
-                    heapq.heappush(celf_queue, (-actual_gain, e))
+                    heapq.heappush(celf_queue, (-actual_gain, e, step))
             
             if best_edge:
                 blocked_edges.add(best_edge)
                 output_lines.append(best_edge)
                 write_output(output_lines, out_file, k)
+                budget.record('step', time.time() - t_step)
+                checkpoint(celf_queue, seen_candidates)
             else:
                 break
 
+        # Out of time, or no edge has a positive gain in the sampled worlds:
+        # fill the remaining budget from RR coverage.
+        if len(output_lines) < k:
+            rr_index, padded = rr_fill(rr_index, weighted_edges, A0, hops, blocked_edges,
+                                       output_lines, k, time.time() + rr_window())
+            write_output(output_lines, out_file, k)
+
+        checkpoint(celf_queue, seen_candidates, force=True)
+
     else:
         super_root = -1
         A0_set = set(A0)
         
         
-        for step in range(k):
-            if time.time() - start_time > TIME_LIMIT:
+        for step in range(len(output_lines), k):
+            # Each step recomputes all gains from scratch, so the number of
+            # worlds can shrink between steps to keep k steps in the budget.
+            share = budget.usable() / (k - step)
+            step_cost = budget.cost('step', 0.0)
+            if step_cost > share and r_eff > MIN_R:
+                r_new = max(MIN_R, int(r_eff * share / step_cost))
+                budget.scale('step', r_new / r_eff)
+                r_eff = r_new
+            if budget.usable() < budget.cost('step', 0.0):
+                degraded = len(output_lines)
                 break
-            gains = compute_dominator_gains(A0, adj, super_root, A0_set, r, blocked_edges)
+            with budget.measure('step'), PROFILE.phase('dominator_gains'):
+                gains = compute_dominator_gains(A0, adj, super_root, A0_set, r_eff, blocked_edges)
             if not gains:
                 break
             
@@ -349,6 +579,26 @@ def main():
             blocked_edges.add(best_edge)
             output_lines.append(best_edge)
             write_output(output_lines, out_file, k)
+            checkpoint()
+
+        if len(output_lines) < k:
+            rr_index, padded = rr_fill(rr_index, weighted_edges, A0, hops, blocked_edges,
+                                       output_lines, k, time.time() + rr_window())
+            write_output(output_lines, out_file, k)
+
+        checkpoint(force=True)
+
+    if degraded is not None:
+        print(f"Time budget: exact selection stopped after {degraded} edges; "
+              f"{len(output_lines) - degraded - padded} more came from RR sets, "
+              f"{padded} from out-degree padding")
+    if r_eff < r:
+        print(f"Time budget: gains evaluated on {r_eff} of {r} sampled worlds")
+
+    if args.profile:
+        PROFILE.dump(args.profile, mode=args.mode, k=k, r=r, r_eff=r_eff, hops=hops,
+                     selected=len(output_lines), time_limit=args.time_limit,
+                     resumed=resumed is not None, degraded=degraded)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+"""
+Wall-clock budget for the Q2 greedy solver.
+
+The solver records how long each kind of work takes ("probe" = one
+reachability evaluation, "refresh", "step", ...) and asks the budget how much
+of that work still fits before the deadline. A reserve at the end of the
+budget is held back so the solver can always switch to the cheap RR-based
+selection and write a complete output file.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class Budget:
+    def __init__(self, time_limit, start=None, reserve_frac=0.05,
+                 min_reserve=5.0, max_reserve=120.0, smoothing=0.3):
+        self.start = time.time() if start is None else start
+        self.deadline = self.start + time_limit
+        self.reserve = min(max_reserve, max(min_reserve, reserve_frac * time_limit))
+        self.reserve = min(self.reserve, 0.5 * time_limit)
+        self.smoothing = smoothing
+        self._cost = {}
+
+    def remaining(self):
+        """Seconds until the hard deadline."""
+        return self.deadline - time.time()
+
+    def usable(self):
+        """Seconds left before the reserve is reached."""
+        return self.remaining() - self.reserve
+
+    def expired(self):
+        return self.usable() <= 0
+
+    def record(self, name, seconds):
+        """Fold one observed duration into the moving average for `name`."""
+        prev = self._cost.get(name)
+        if prev is None:
+            self._cost[name] = seconds
+        else:
+            self._cost[name] = prev + self.smoothing * (seconds - prev)
+
+    def scale(self, name, factor):
+        """Rescale a recorded cost, e.g. after changing the work per unit."""
+        if name in self._cost:
+            self._cost[name] *= factor
+
+    def cost(self, name, default=None):
+        return self._cost.get(name, default)
+
+    @contextmanager
+    def measure(self, name, count=1):
+        """Time a block and record it as `count` units of `name`."""
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            if count > 0:
+                self.record(name, (time.time() - t0) / count)
+
+    def affordable(self, name, fraction=1.0):
+        """How many more units of `name` fit in `fraction` of the usable time."""
+        c = self.cost(name)
+        if not c:
+            return float('inf')
+        return max(0, int(fraction * self.usable() / c))
@@ -0,0 +1,92 @@
+"""
+Binary checkpoints for the Q2 greedy solver.
+
+A checkpoint holds everything needed to continue the greedy loop without
+redoing earlier steps:
+
+  - the solver mode (celf, sketch or dominator), whose state it holds,
+  - the RNG seed, r and hops the live-edge masks were drawn with (masks are
+    regenerated from the seed on resume instead of being stored), and the
+    number of worlds r_eff <= r the time budget chose to evaluate gains on,
+  - graph_cache.file_digest of the graph file, so a checkpoint is never
+    resumed on a different (or edited) graph,
+  - the blocked edges in selection order,
+  - the CELF heap as (gain, u, v, stamp) rows, where stamp is the greedy step
+    at which the gain was last computed (a gain is exact iff stamp == step),
+  - the candidate edges already evaluated at least once.
+
+Layout: a fixed little-endian header followed by three int64 arrays.
+"""
+
+import os
+import sys
+import struct
+from array import array
+
+MAGIC = b'Q2CK'
+VERSION = 5
+_HEADER = struct.Struct('<4sH12sqqqq16sqqq')
+
+
+def _write_array(fh, values):
+    arr = array('q', values)
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    arr.tofile(fh)
+
+
+def _read_array(fh, n):
+    arr = array('q')
+    arr.fromfile(fh, n)
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr
+
+
+def save_checkpoint(path, seed, r, hops, graph_digest, blocked_order,
+                    celf_queue=(), seen_candidates=(), r_eff=None, mode='celf'):
+    """Atomically write the solver state to `path` (via a temp file + rename)."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as fh:
+        fh.write(_HEADER.pack(MAGIC, VERSION, mode.encode(), seed, r, r if r_eff is None else r_eff,
+                              hops, bytes.fromhex(graph_digest),
+                              len(blocked_order), len(celf_queue), len(seen_candidates)))
+        _write_array(fh, (x for u, v in blocked_order for x in (u, v)))
+        _write_array(fh, (x for neg_gain, (u, v), stamp in celf_queue
+                          for x in (-neg_gain, u, v, stamp)))
+        _write_array(fh, (x for u, v in seen_candidates for x in (u, v)))
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint written by save_checkpoint.
+
+    Returns a dict with mode, seed, r, r_eff, hops, graph_digest, blocked_order (list of
+    edges), celf_queue (heap-ordered list of (-gain, edge, stamp)) and
+    seen_candidates (set of edges). Raises ValueError on a foreign file.
+    """
+    with open(path, 'rb') as fh:
+        raw = fh.read(_HEADER.size)
+        if len(raw) != _HEADER.size:
+            raise ValueError(f"'{path}' is truncated")
+        magic, version, mode, seed, r, r_eff, hops, graph_digest, n_blocked, n_heap, n_seen = \
+            _HEADER.unpack(raw)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"'{path}' is not a Q2 checkpoint (version {VERSION})")
+        blocked = _read_array(fh, 2 * n_blocked)
+        heap = _read_array(fh, 4 * n_heap)
+        seen = _read_array(fh, 2 * n_seen)
+
+    return {
+        'mode': mode.rstrip(b'\0').decode(),
+        'seed': seed,
+        'r': r,
+        'r_eff': r_eff,
+        'hops': hops,
+        'graph_digest': graph_digest.hex(),
+        'blocked_order': [(blocked[i], blocked[i + 1]) for i in range(0, len(blocked), 2)],
+        'celf_queue': [(-heap[i], (heap[i + 1], heap[i + 2]), heap[i + 3])
+                       for i in range(0, len(heap), 4)],
+        'seen_candidates': {(seen[i], seen[i + 1]) for i in range(0, len(seen), 2)},
+    }
@@ -0,0 +1,112 @@
+"""
+Binary cache for forest-fire edge lists.
+
+The first load of `graph.txt` parses it once and stores three arrays next to
+it, under `.graph_cache/<name>.<hash>/`:
+
+  src.npy  int64   edge sources
+  dst.npy  int64   edge targets
+  p.npy    float64 edge probabilities (NaN where the line had no p)
+  has_p.npy bool   whether the line had a p field (a literal `nan` p is
+                   NaN in p.npy but True here)
+  skipped.npy int64 number of lines that could not be parsed
+
+The key is a hash of the file contents, so an edited graph is re-parsed and a
+renamed one is not. Later loads memory-map the arrays instead of parsing text.
+"""
+
+import os
+import hashlib
+
+import numpy as np
+
+CACHE_DIR = '.graph_cache'
+CACHE_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'v{CACHE_VERSION}'.encode())
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_edge_list(path):
+    """
+    Parse a text edge list (`u v [p]` per line, `#` comments allowed).
+
+    Lines with fewer than two fields or unparseable numbers are skipped.
+    Returns (src, dst, p, has_p, n_skipped).
+    """
+    src, dst, prob, has_p = [], [], [], []
+    skipped = 0
+    with open(path, 'r') as fh:
+        for line in fh:
+            parts = line.split()
+            if not parts or parts[0].startswith('#'):
+                continue
+            try:
+                u, v = int(parts[0]), int(parts[1])
+                p = float(parts[2]) if len(parts) >= 3 else float('nan')
+            except (ValueError, IndexError):
+                skipped += 1
+                continue
+            src.append(u)
+            dst.append(v)
+            prob.append(p)
+            has_p.append(len(parts) >= 3)
+    return (np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64),
+            np.array(prob, dtype=np.float64), np.array(has_p, dtype=bool), skipped)
+
+
+def load_edge_arrays(path, use_cache=True, digest=None):
+    """
+    Return (src, dst, p, has_p, n_skipped) for the edge list at `path`.
+
+    Served from the binary cache when present (memory-mapped, read-only);
+    otherwise the file is parsed and, if the directory is writable, cached.
+    n_skipped counts the unparseable lines, so cached loads can still warn.
+    `digest` is file_digest(path) when the caller already computed it.
+    """
+    if not use_cache:
+        return parse_edge_list(path)
+
+    key = f'{os.path.basename(path)}.{digest or file_digest(path)}'
+    cache = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR, key)
+    names = ('src', 'dst', 'p', 'has_p', 'skipped')
+    files = [os.path.join(cache, f'{n}.npy') for n in names]
+
+    if all(os.path.exists(f) for f in files):
+        src, dst, p, has_p = (np.load(f, mmap_mode='r') for f in files[:4])
+        return src, dst, p, has_p, int(np.load(files[4]))
+
+    src, dst, p, has_p, skipped = parse_edge_list(path)
+    try:
+        os.makedirs(cache, exist_ok=True)
+        for f, arr in zip(files, (src, dst, p, has_p, np.int64(skipped))):
+            tmp = f + '.tmp.npy'
+            np.save(tmp, arr)
+            os.replace(tmp, f)
+    except OSError:
+        pass
+    return src, dst, p, has_p, skipped
+
+
+def sample_live_masks(p, r, rng, chunk_edges=1 << 16):
+    """
+    Draw r live/dead coins per edge (live with probability p) as bitmasks.
+
+    Returns a list of Python ints, bit i set iff the edge is live in world i,
+    so masks can be tested exactly like the ones built with `random.random()`.
+    Works in chunks of `chunk_edges` edges to bound the (edges x r) buffer.
+    """
+    p = np.nan_to_num(np.asarray(p, dtype=np.float64), nan=1.0)
+    masks = []
+    for start in range(0, len(p), chunk_edges):
+        block = p[start:start + chunk_edges]
+        coins = rng.random((len(block), r)) < block[:, None]
+        packed = np.packbits(coins, axis=1, bitorder='little')
+        masks.extend(int.from_bytes(row.tobytes(), 'little') for row in packed)
+    return masks
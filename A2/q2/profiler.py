@@ -0,0 +1,50 @@
+"""
+Lightweight counters and phase timers for the Q2 solver.
+
+Counters and timers are always collected (they are updated per call or per
+expanded node, never per edge, so the overhead is negligible); `--profile`
+only decides whether the report is written out as JSON. Phase times are
+inclusive: a phase nested in another is counted in both.
+"""
+
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Profiler:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.counters = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - t0
+            self.calls[name] += 1
+
+    def report(self, **meta):
+        return {
+            'meta': meta,
+            'wall_seconds': round(time.perf_counter() - self.start, 6),
+            'phases': {name: {'seconds': round(self.seconds[name], 6),
+                              'calls': self.calls[name]}
+                       for name in sorted(self.seconds, key=self.seconds.get, reverse=True)},
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def dump(self, path, **meta):
+        with open(path, 'w') as fh:
+            json.dump(self.report(**meta), fh, indent=2)
+
+
+PROFILE = Profiler()
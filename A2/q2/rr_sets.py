@@ -0,0 +1,228 @@
+"""
+Reverse-reachable (RR) set index for forest-fire edge blocking.
+
+Each sample picks a target node v uniformly among the nodes structurally
+reachable from A0 (within `hops`, if set), draws a live-edge world lazily by
+walking v's in-edges backwards (edge (u, x) is live with probability p_ux,
+independent-cascade model), and records the edges whose removal alone would
+cut every A0 -> v path in that world. An edge covering a fraction c of the
+samples therefore saves about c * |targets| burned nodes in expectation, and
+blocking a set of edges is scored by the fraction of samples it covers.
+
+RR sets are stored flat (one `array` of edge ids plus offsets) together with
+an edge -> sample inverted index, so tens of thousands of samples stay cheap.
+
+With a hop limit only edges lying on some A0 -> v path of length <= hops are
+considered; the result is a conservative subset of the true critical edges.
+Hop-limited walks are short; with unlimited spread on a dense graph each
+backward walk may cover most of the graph, so use fewer samples there.
+"""
+
+import time
+import heapq
+import random
+from array import array
+from collections import defaultdict, deque
+
+
+class RRIndex:
+    def __init__(self, weighted_edges, A0, hops=-1):
+        """
+        weighted_edges : list of (u, v, p) graph edges
+        A0             : initially burning nodes
+        hops           : -1 for unlimited spread, else the hop limit
+        """
+        self.edges = [(u, v) for u, v, _ in weighted_edges]
+        self.edge_id = {e: i for i, e in enumerate(self.edges)}
+        self.A0_set = set(A0)
+        self.hops = hops
+
+        self.rev = defaultdict(list)
+        fwd = defaultdict(list)
+        for eid, (u, v, p) in enumerate(weighted_edges):
+            self.rev[v].append((u, p, eid))
+            fwd[u].append(v)
+
+        # Sample roots: nodes reachable from A0 at all (ignoring coins). The
+        # structural depth also prunes the backward walks below.
+        depth = {u: 0 for u in self.A0_set}
+        q = deque(self.A0_set)
+        while q:
+            u = q.popleft()
+            if hops >= 0 and depth[u] >= hops:
+                continue
+            for v in fwd.get(u, ()):
+                if v not in depth:
+                    depth[v] = depth[u] + 1
+                    q.append(v)
+        self.depth = depth
+        self.targets = [u for u in depth if u not in self.A0_set]
+
+        self.items = array('i')
+        self.offsets = array('q', [0])
+        self.edge_items = None
+        self.edge_offsets = None
+
+    @property
+    def num_samples(self):
+        return len(self.offsets) - 1
+
+    @property
+    def scale(self):
+        """Expected burned nodes saved per covered sample."""
+        return len(self.targets) / max(self.num_samples, 1)
+
+    def samples_of(self, eid):
+        """Sample ids whose RR set contains edge `eid`."""
+        return self.edge_items[self.edge_offsets[eid]:self.edge_offsets[eid + 1]]
+
+    def sample(self, num_samples, rng=random, deadline=None):
+        """
+        Draw `num_samples` more RR sets and rebuild the inverted index.
+
+        If `deadline` (a time.time() value) passes first, sampling stops early
+        with fewer samples; the estimates stay unbiased, only noisier.
+        """
+        if self.targets:
+            for n in range(num_samples):
+                if deadline is not None and n % 64 == 0 and time.time() >= deadline:
+                    break
+                v = rng.choice(self.targets)
+                self.items.extend(self._critical_edges(v, rng))
+                self.offsets.append(len(self.items))
+        self._build_inverted()
+
+    def _critical_edges(self, v, rng):
+        hops = self.hops
+        A0_set = self.A0_set
+        depth = self.depth
+
+        # Backward walk from v, flipping each in-edge coin exactly once. Nodes
+        # that A0 cannot reach (within the hops left) are never entered.
+        dr = {v: 0}
+        live = defaultdict(list)
+        sources = []
+        q = deque([v])
+        while q:
+            x = q.popleft()
+            if x in A0_set:
+                sources.append(x)
+                continue
+            d = dr[x]
+            if hops >= 0 and d >= hops:
+                continue
+            for u, p, eid in self.rev.get(x, ()):
+                du = depth.get(u)
+                if du is None or (hops >= 0 and du + d + 1 > hops):
+                    continue
+                if rng.random() < p:
+                    live[u].append((x, eid))
+                    if u not in dr:
+                        dr[u] = d + 1
+                        q.append(u)
+        if not sources:
+            return ()
+
+        # Forward BFS from A0 inside the RR set: distances and one shortest path.
+        df = {a: 0 for a in sources}
+        parent = {}
+        q = deque(sources)
+        while q:
+            u = q.popleft()
+            for x, eid in live.get(u, ()):
+                if x not in df:
+                    df[x] = df[u] + 1
+                    parent[x] = (u, eid)
+                    q.append(x)
+
+        path = [v]
+        path_eids = []
+        while path[-1] in parent:
+            u, eid = parent[path[-1]]
+            path.append(u)
+            path_eids.append(eid)
+        path.reverse()
+        path_eids.reverse()
+        pos = {x: i for i, x in enumerate(path)}
+
+        def usable(a, b):
+            return hops < 0 or df.get(a, hops + 1) + 1 + dr[b] <= hops
+
+        # Edge path[i] -> path[i+1] is critical iff nothing reachable from
+        # A0 without it re-enters the path beyond i.
+        critical = []
+        explored = set()
+        reach = 0
+        for i in range(len(path) - 1):
+            stack = [path[i]]
+            if i == 0:
+                stack.extend(a for a in sources if a not in pos)
+            while stack:
+                y = stack.pop()
+                if y in explored:
+                    continue
+                explored.add(y)
+                for b, eid in live.get(y, ()):
+                    if eid == path_eids[i] or not usable(y, b):
+                        continue
+                    if b in pos:
+                        reach = max(reach, pos[b])
+                    elif b not in explored:
+                        stack.append(b)
+            if reach <= i:
+                critical.append(path_eids[i])
+        return critical
+
+    def _build_inverted(self):
+        counts = array('q', bytes(8 * (len(self.edges) + 1)))
+        for eid in self.items:
+            counts[eid + 1] += 1
+        for i in range(len(self.edges)):
+            counts[i + 1] += counts[i]
+        self.edge_offsets = counts
+        fill = array('q', counts)
+        self.edge_items = array('i', bytes(4 * len(self.items)))
+        for s in range(self.num_samples):
+            for j in range(self.offsets[s], self.offsets[s + 1]):
+                eid = self.items[j]
+                self.edge_items[fill[eid]] = s
+                fill[eid] += 1
+
+    def edge_scores(self):
+        """Coverage count of every edge that appears in some RR set."""
+        offs = self.edge_offsets
+        return {self.edges[eid]: offs[eid + 1] - offs[eid]
+                for eid in range(len(self.edges)) if offs[eid + 1] > offs[eid]}
+
+    def greedy(self, k, blocked=()):
+        """
+        Lazy greedy max-coverage: up to k edges maximising covered samples.
+
+        Samples already covered by `blocked` edges do not count. Returns a
+        list of (edge, newly_covered_samples) in selection order.
+        """
+        covered = bytearray(self.num_samples)
+        for e in blocked:
+            eid = self.edge_id.get(e)
+            if eid is not None:
+                for s in self.samples_of(eid):
+                    covered[s] = 1
+
+        offs = self.edge_offsets
+        heap = [(-(offs[eid + 1] - offs[eid]), eid)
+                for eid in range(len(self.edges)) if offs[eid + 1] > offs[eid]]
+        heapq.heapify(heap)
+
+        chosen = []
+        while heap and len(chosen) < k:
+            _, eid = heapq.heappop(heap)
+            gain = sum(1 for s in self.samples_of(eid) if not covered[s])
+            if gain == 0:
+                continue
+            if heap and gain < -heap[0][0]:
+                heapq.heappush(heap, (-gain, eid))
+                continue
+            for s in self.samples_of(eid):
+                covered[s] = 1
+            chosen.append((self.edges[eid], gain))
+        return chosen
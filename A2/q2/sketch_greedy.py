@@ -0,0 +1,131 @@
+"""
+Sketch-based gain estimates for stochastic-greedy edge blocking.
+
+For every sampled world i the burned set B_i (BFS from A0 over live,
+unblocked edges, hop-limited if required) and its shortest-path DAG are
+built. Every (world, node) pair gets a pseudo-random rank in [0, 1), and a
+bottom-k reachability sketch of each burned node v holds the k smallest ranks
+among the nodes v reaches in that DAG through nodes with a single DAG entry
+(Cohen's pruned reverse-BFS build, not propagated past multi-entry nodes).
+
+Blocking edge (u, v) is estimated to save, in world i, the nodes so reached
+from v whenever (u, v) is v's only DAG entry; the sketches of v over
+all such worlds are merged and the union size is estimated with the usual
+bottom-k estimator (k - 1) / tau_k. Estimates are in the same units as the
+total reach returned by Q2.get_h_hop_reachability (summed over worlds).
+
+Nodes with several entries are never counted as saved and longer detours
+are ignored, so the estimate is only a screen: each stochastic greedy step
+verifies the top few screened edges plus a random subsample of the others
+with exact probes.
+"""
+
+import math
+import random
+from collections import defaultdict
+
+_MASK64 = (1 << 64) - 1
+
+
+def _rank(world, node, salt):
+    # splitmix64 of (world, node, salt), mapped to [0, 1).
+    z = (node * 0x9E3779B97F4A7C15 + world * 0xBF58476D1CE4E5B9 + salt) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return (z ^ (z >> 31)) / 2.0 ** 64
+
+
+def _merge_bottom_k(a, b, k):
+    return sorted(set(a) | set(b))[:k]
+
+
+def bottom_k_estimate(sketch, k):
+    """Cardinality estimate of the set summarised by a bottom-k sketch."""
+    if len(sketch) < k:
+        return float(len(sketch))
+    return (k - 1) / sketch[k - 1]
+
+
+def sketch_gains(r, A0, hops, adj, blocked, sketch_k=32, salt=0):
+    """Estimated reach reduction of blocking each live frontier edge."""
+    per_edge = defaultdict(list)
+
+    for i in range(r):
+        bit = 1 << i
+        depth = {u: 0 for u in A0}
+        order = list(A0)
+        q_idx = 0
+        while q_idx < len(order):
+            u = order[q_idx]
+            q_idx += 1
+            if depth[u] == hops:
+                continue
+            for v, mask in adj.get(u, ()):
+                if (mask & bit) and (u, v) not in blocked and v not in depth:
+                    depth[v] = depth[u] + 1
+                    order.append(v)
+
+        # Shortest-path DAG of B_i: live, unblocked edges one level down.
+        # Dropping same-level and backward edges keeps cycles through A0
+        # from making every node "reach" the whole burned set.
+        rev = defaultdict(list)
+        for u in order:
+            if depth[u] == hops:
+                continue
+            du = depth[u] + 1
+            for v, mask in adj.get(u, ()):
+                if (mask & bit) and (u, v) not in blocked and depth.get(v) == du:
+                    rev[v].append(u)
+
+        sketch = defaultdict(list)
+        for rank, x in sorted((_rank(i, x, salt), x) for x in order):
+            stack = [x]
+            seen = {x}
+            while stack:
+                y = stack.pop()
+                if len(sketch[y]) >= sketch_k:
+                    continue
+                sketch[y].append(rank)
+                ins = rev.get(y, ())
+                # Only single-entry nodes pass reach on, x included: a node
+                # with several entries stays reachable when one is blocked.
+                if len(ins) != 1:
+                    continue
+                for w in ins:
+                    if w not in seen:
+                        seen.add(w)
+                        stack.append(w)
+
+        for v, ins in rev.items():
+            if len(ins) == 1 and depth[v] > 0:
+                per_edge[(ins[0], v)].append(sketch[v])
+
+    gains = {}
+    for e, sketches in per_edge.items():
+        merged = []
+        for sk in sketches:
+            merged = _merge_bottom_k(merged, sk, sketch_k)
+        gains[e] = bottom_k_estimate(merged, sketch_k)
+    return gains
+
+
+def sample_size(n, k, epsilon):
+    """Stochastic-greedy subsample size (n / k) * ln(1 / epsilon), at least 1."""
+    return max(1, min(n, math.ceil(n / max(k, 1) * math.log(1.0 / epsilon))))
+
+
+def stochastic_shortlist(gains, k, epsilon, verify, rng=random):
+    """
+    Edges to evaluate exactly in one stochastic-greedy step.
+
+    The `verify` edges with the largest sketch estimate are always included
+    (the estimates come for free once the sketches exist), plus a uniform
+    random subsample of the remaining candidates of size
+    (n / k) * ln(1 / epsilon), which protects against edges the sketch
+    screen underrates.
+    """
+    ranked = sorted(gains, key=lambda e: (-gains[e], e))
+    head, rest = ranked[:verify], sorted(ranked[verify:])
+    if not rest:
+        return head
+    return head + rng.sample(rest, sample_size(len(rest), k, epsilon))
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+
+from main import configure_parallelism, load_vector_matrix, ndcg_at_k_batch
+from submission import _base_fingerprint, _build_index, _index_params, _knn_search, _set_search_param
+
+
+def synthetic_dataset(N: int, Q: int, d: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Base and query vectors drawn around sqrt(N) Gaussian centres of varying spread."""
+    rng = np.random.default_rng(seed)
+    n_centers = max(1, int(np.sqrt(N)))
+    centers = rng.normal(scale=4.0, size=(n_centers, d)).astype(np.float32)
+    spread = rng.uniform(0.5, 2.0, size=n_centers).astype(np.float32)
+
+    def draw(n: int) -> np.ndarray:
+        c = rng.integers(n_centers, size=n)
+        return centers[c] + spread[c, None] * rng.standard_normal((n, d), dtype=np.float32)
+
+    return draw(N), draw(Q)
+
+
+def neighbour_ids(search: Callable[[np.ndarray], np.ndarray], queries: np.ndarray, k: int,
+                  batch: int = 65536) -> np.ndarray:
+    """(Q, k) neighbour ids of every query, searched in batches of `batch` rows."""
+    out = np.empty((len(queries), k), dtype=np.int64)
+    for s in range(0, len(queries), batch):
+        out[s:s + batch] = search(np.ascontiguousarray(queries[s:s + batch], dtype=np.float32))
+    return out
+
+
+def neighbour_counts(ids: np.ndarray, N: int) -> np.ndarray:
+    """How often each base item is among the k nearest neighbours of a query."""
+    flat = ids.ravel()
+    return np.bincount(flat[flat >= 0], minlength=N).astype(np.int64)
+
+
+def recall_at_k(ids: np.ndarray, exact: np.ndarray) -> float:
+    """Mean fraction of each query's exact k nearest neighbours that were found."""
+    if not len(exact):
+        return 1.0
+    hits = sum(len(np.intersect1d(a, e)) for a, e in zip(ids, exact))
+    return hits / exact.size
+
+
+def top_k(counts: np.ndarray, K: int) -> np.ndarray:
+    """Top-K items by count (desc), ties by index (asc), as solve() ranks them."""
+    return np.argsort(-counts, kind="stable")[:K].astype(np.int64)
+
+
+def exact_ids(base: np.ndarray, queries: np.ndarray, k: int, cache_dir: Optional[Path]) -> np.ndarray:
+    """
+    Exact (Q, k) neighbour ids from a flat index, cached in cache_dir as
+    gt_<base fingerprint>_<query fingerprint>_k<k>.npy so every K (and every
+    later run) reuses them.
+    """
+    path = None
+    if cache_dir is not None:
+        path = cache_dir / f"gt_{_base_fingerprint(base)}_{_base_fingerprint(queries)}_k{k}.npy"
+        if path.exists():
+            return np.load(path)
+    index = _build_index("flat", {}, base)
+    ids = neighbour_ids(lambda qs: _knn_search(index, "flat", base, qs, k), queries, k)
+    if path is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        np.save(path, ids)
+    return ids
+
+
+def index_bytes(index: Any) -> int:
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def configurations(args: argparse.Namespace, N: int, d: int) -> Iterator[tuple[str, dict, list[dict]]]:
+    """
+    (kind, build params, list of search params) for every index in the grid.
+    Build params start from solve()'s own (_index_params) and override only
+    the swept values, so training sizes, seeds and PQ settings match.
+    """
+    for kind in args.indexes:
+        if kind not in ("flat", "hnsw", "ivf", "ivfpq"):
+            raise ValueError(f"unknown index type '{kind}'")
+        if kind == "flat":
+            yield kind, {}, [{}]
+        elif kind == "hnsw":
+            for M, ef_c in itertools.product(args.hnsw_M, args.efConstruction):
+                yield kind, {"M": M, "efConstruction": ef_c}, [{"efSearch": ef} for ef in args.efSearch]
+        else:
+            nlists = args.nlist or [int(np.clip(np.sqrt(N) * s, 16, 4096)) for s in (0.5, 1.0, 2.0)]
+            for nlist in sorted(set(nlists)):
+                params = _index_params(kind, N, d, float("inf"), nlist=nlist)
+                yield kind, params, [{"nprobe": p} for p in args.nprobe if p <= nlist]
+
+
+def run_dataset(name: str, base: np.ndarray, queries: np.ndarray, args: argparse.Namespace) -> list[dict]:
+    N, d = base.shape
+    t0 = time.perf_counter()
+    exact = exact_ids(base, queries, args.k, args.gt_cache)
+    gt = top_k(neighbour_counts(exact, N), args.K)
+    print(f"[{name}] N={N} Q={len(queries)} d={d}: ground truth in "
+          f"{time.perf_counter() - t0:.2f}s", file=sys.stderr)
+
+    rows = []
+    for threads in args.threads:
+        configure_parallelism(True, threads)
+        for kind, build, searches in configurations(args, N, d):
+            t0 = time.perf_counter()
+            index = _build_index(kind, build, base)
+            build_s = time.perf_counter() - t0
+            memory = index_bytes(index)
+            shown = {key: val for key, val in build.items() if key not in ("train_size", "seed")}
+            found, rankings = [], []
+            for search in searches:
+                if search:
+                    _set_search_param(index, kind, next(iter(search.values())))
+                t0 = time.perf_counter()
+                ids = neighbour_ids(lambda qs: _knn_search(index, kind, base, qs, args.k, args.rerank),
+                                    queries, args.k)
+                search_s = time.perf_counter() - t0
+                rankings.append(top_k(neighbour_counts(ids, N), args.K))
+                found.append({
+                    "dataset": name, "index": kind, "threads": threads,
+                    "params": ",".join(f"{key}={val}" for key, val in {**shown, **search}.items()),
+                    "build_s": build_s, "search_s": search_s, "total_s": build_s + search_s,
+                    "memory_mb": memory / 2**20,
+                    "recall": recall_at_k(ids, exact),
+                })
+            # Scored like the harness scores a run (main.ndcg_at_k_batch).
+            for row, score in zip(found, ndcg_at_k_batch(np.stack(rankings), gt)):
+                row["score"] = float(score)
+                print(f"[{name}] {kind:6s} {row['params']:32s} threads={threads} "
+                      f"total={row['total_s']:.2f}s nDCG={row['score']:.4f} "
+                      f"recall@{args.k}={row['recall']:.4f}", file=sys.stderr)
+            rows += found
+    return rows
+
+
+def pareto_front(rows: list[dict]) -> list[dict]:
+    """Rows not dominated in (higher score, lower total_s, lower memory_mb), by time."""
+    def dominates(a: dict, b: dict) -> bool:
+        no_worse = (a["score"] >= b["score"] and a["total_s"] <= b["total_s"]
+                    and a["memory_mb"] <= b["memory_mb"])
+        better = (a["score"] > b["score"] or a["total_s"] < b["total_s"]
+                  or a["memory_mb"] < b["memory_mb"])
+        return no_worse and better
+
+    front = [r for r in rows if not any(dominates(o, r) for o in rows)]
+    return sorted(front, key=lambda r: r["total_s"])
+
+
+def format_table(rows: list[dict]) -> str:
+    cols = ["index", "params", "threads", "build_s", "search_s", "total_s", "memory_mb", "score", "recall"]
+    cells = [[f"{r[c]:.4f}" if isinstance(r[c], float) else str(r[c]) for c in cols] for r in rows]
+    out = ["| " + " | ".join(cols) + " |", "|" + "---|" * len(cols)]
+    out += ["| " + " | ".join(row) + " |" for row in cells]
+    return "\n".join(out)
+
+
+def write_results(path: Path, rows: list[dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix.lower() == ".json":
+        with open(path, "w") as fh:
+            json.dump(rows, fh, indent=2)
+        return
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(rows[0]) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _ints(text: str) -> list[int]:
+    return [int(x) for x in text.split(",") if x]
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Sweep FAISS index types and parameters for the Q1 objective")
+    p.add_argument("--data", nargs=2, action="append", default=[], type=Path,
+                   metavar=("BASE", "QUERY"), help="Real dataset as two .npy files (repeatable)")
+    p.add_argument("--synthetic", nargs=3, action="append", default=[], type=int,
+                   metavar=("N", "Q", "D"), help="Clustered Gaussian dataset (repeatable)")
+    p.add_argument("--mmap", action="store_true", help="Memory-map --data inputs")
+    p.add_argument("--k", type=int, default=10, help="Neighbors per query")
+    p.add_argument("--K", type=int, default=100, help="Size of ranked list / nDCG cutoff")
+    p.add_argument("--indexes", type=lambda s: s.split(","), default=["flat", "hnsw", "ivf"],
+                   help="Comma-separated subset of flat,hnsw,ivf,ivfpq")
+    p.add_argument("--hnsw_M", type=_ints, default=[8, 16, 32])
+    p.add_argument("--efConstruction", type=_ints, default=[40])
+    p.add_argument("--efSearch", type=_ints, default=[16, 32, 64, 128])
+    p.add_argument("--nlist", type=_ints, default=None, help="Default: sqrt(N) x {0.5, 1, 2}")
+    p.add_argument("--nprobe", type=_ints, default=[1, 4, 16, 64])
+    p.add_argument("--rerank", type=int, default=4,
+                   help="ivfpq: re-rank k x this many PQ candidates exactly (as Q1_RERANK)")
+    p.add_argument("--threads", type=lambda s: [None if x == "all" else int(x) for x in s.split(",")],
+                   default=[None], help="Comma-separated thread counts ('all' = every core)")
+    p.add_argument("--gt_cache", type=Path, default=Path(".bench_cache"),
+                   help="Directory for cached exact neighbour ids")
+    p.add_argument("--results", type=Path, default=None, help="Write every row to .csv or .json")
+    args = p.parse_args(argv)
+    if not args.data and not args.synthetic:
+        p.error("give at least one --data or --synthetic dataset")
+    return args
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    import faiss
+
+    args = parse_args(argv)
+    # Resolve 'all' once, before any configure_parallelism call lowers it.
+    cores = faiss.omp_get_max_threads()
+    args.threads = [cores if n is None else n for n in args.threads]
+
+    datasets = [(f"{b.stem}", lambda b=b, q=q: (load_vector_matrix(b, args.mmap),
+                                                load_vector_matrix(q, args.mmap)))
+                for b, q in args.data]
+    datasets += [(f"synthetic_{N}x{Q}x{d}", lambda N=N, Q=Q, d=d: synthetic_dataset(N, Q, d))
+                 for N, Q, d in args.synthetic]
+
+    rows = []
+    for name, load in datasets:
+        base, queries = load()
+        if base.shape[1] != queries.shape[1]:
+            raise ValueError(f"{name}: base has d={base.shape[1]}, queries have d={queries.shape[1]}")
+        found = run_dataset(name, base, queries, args)
+        rows += found
+        print(f"\n## {name}: Pareto front (nDCG@{args.K} vs total time vs index memory)\n")
+        print(format_table(pareto_front(found)))
+
+    if args.results is not None:
+        write_results(args.results, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
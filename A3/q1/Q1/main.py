@@ -6,6 +6,7 @@ import multiprocessing as mp
 import os
 import sys
 import time
+from multiprocessing import shared_memory
 from pathlib import Path
 from typing import Any, Optional, Tuple
 
@@ -27,6 +28,9 @@ def load_vector_matrix(path: Path, mmap: bool) -> np.ndarray:
     arr = np.load(path, mmap_mode="r" if mmap else None)
     if arr.ndim != 2:
         raise ValueError(f"Expected 2D array in {path}, got shape {arr.shape}")
+    if mmap:
+        # Left on disk as is; solve() converts one batch at a time.
+        return arr
     if arr.dtype != np.float32:
         arr = np.ascontiguousarray(arr, dtype=np.float32)
     else:
@@ -45,31 +49,57 @@ def load_ground_truth(path: Path) -> np.ndarray:
     return gt
 
 
-def ndcg_at_k(student_ranking: np.ndarray, ground_truth: np.ndarray) -> float:
-    K = int(ground_truth.shape[0])
+def ndcg_at_k_batch(student_rankings: np.ndarray, ground_truth: np.ndarray) -> np.ndarray:
+    """
+    nDCG@K of every row of a (B, L) batch of rankings against one ground truth.
+
+    Same definition as a per-list loop: the item at rank i of the ground
+    truth has relevance K - i (the last rank wins for a repeated item),
+    unknown items (including -1 padding) have relevance 0, only the first K
+    entries of a ranking count, and an item repeated in a ranking gains
+    nothing after its first occurrence. Sums are accumulated left to right
+    with np.cumsum, so each score equals the loop's bit for bit.
+    """
+    gt = np.asarray(ground_truth, dtype=np.int64).ravel()
+    R = np.asarray(student_rankings, dtype=np.int64)
+    if R.ndim == 1:
+        R = R[None, :]
+    K = int(gt.shape[0])
+    B = R.shape[0]
     if K == 0:
-        return 1.0
-
-    rel_by_index = {int(ground_truth[i]): float(K - i) for i in range(K)}
-
-    idcg = 0.0
-    for i in range(K):
-        rel = float(K - i)
-        idcg += rel / np.log2(i + 2.0)
+        return np.ones(B)
+    R = R[:, :K]
+    M = R.shape[1]
+    discount = np.log2(np.arange(K, dtype=np.float64) + 2.0)
+    idcg = np.cumsum(np.arange(K, 0, -1, dtype=np.float64) / discount)[-1]
+    if M == 0 or B == 0:
+        return np.zeros(B)
+
+    # Relevance lookup: ground-truth items sorted, keeping the last rank of each.
+    order = np.argsort(gt, kind="stable")
+    keys = gt[order]
+    last = np.r_[keys[1:] != keys[:-1], True]
+    keys, rel_of_key = keys[last], (K - order[last]).astype(np.float64)
+    pos = np.minimum(np.searchsorted(keys, R), len(keys) - 1)
+    rel = np.where(keys[pos] == R, rel_of_key[pos], 0.0)
+
+    # First occurrence of each item within its row.
+    by_value = np.argsort(R, axis=1, kind="stable")
+    sorted_R = np.take_along_axis(R, by_value, axis=1)
+    first_sorted = np.ones_like(sorted_R, dtype=bool)
+    first_sorted[:, 1:] = sorted_R[:, 1:] != sorted_R[:, :-1]
+    first = np.empty_like(first_sorted)
+    np.put_along_axis(first, by_value, first_sorted, axis=1)
+
+    gains = np.where(first, rel / discount[:M], 0.0)
+    dcg = np.cumsum(gains, axis=1)[:, -1]
+    if idcg <= 0.0:
+        return np.zeros(B)
+    return dcg / idcg
 
-    dcg = 0.0
-    seen = set()
-    for j in range(min(K, int(student_ranking.shape[0]))):
-        idx = int(student_ranking[j])
-        if idx in seen:
-            continue
-        seen.add(idx)
-        rel = rel_by_index.get(idx, 0.0)
-        dcg += rel / np.log2(j + 2.0)
 
-    if idcg <= 0.0:
-        return 0.0
-    return float(dcg / idcg)
+def ndcg_at_k(student_ranking: np.ndarray, ground_truth: np.ndarray) -> float:
+    return float(ndcg_at_k_batch(np.asarray(student_ranking).ravel()[None, :], ground_truth)[0])
 
 
 def normalize_student_output(result: Any, K: int) -> np.ndarray:
@@ -84,22 +114,79 @@ def normalize_student_output(result: Any, K: int) -> np.ndarray:
     return out
 
 
+def _memmap_handle(arr: np.ndarray) -> Optional[Tuple[Any, ...]]:
+    """("file", path, offset, dtype, shape, strides) locating a view of a read-only mapped file."""
+    root = arr
+    while isinstance(root.base, np.memmap):
+        root = root.base
+    if not isinstance(root, np.memmap) or not root.filename or root.mode != "r":
+        return None
+    if any(st < 0 for st in arr.strides):
+        return None
+    nbytes = arr.itemsize + sum((n - 1) * st for n, st in zip(arr.shape, arr.strides)) if arr.size else 0
+    start = arr.__array_interface__["data"][0] - root.__array_interface__["data"][0]
+    return ("file", root.filename, root.offset + start, nbytes, arr.dtype.str, arr.shape, arr.strides)
+
+
+def _export_array(arr: np.ndarray, owned: list) -> Tuple[Any, ...]:
+    """
+    Picklable handle for arr that a spawned process can open without a copy
+    travelling through the pipe: the mapped file itself for a read-only
+    memmap, else a shared_memory block (appended to `owned`) holding a copy.
+    """
+    handle = _memmap_handle(arr)
+    if handle is not None:
+        return handle
+    shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+    owned.append(shm)
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return ("shm", shm.name, arr.dtype.str, arr.shape)
+
+
+def _import_array(handle: Tuple[Any, ...], opened: list) -> np.ndarray:
+    if handle[0] == "file":
+        _, path, offset, nbytes, dtype, shape, strides = handle
+        raw = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(nbytes,))
+        return np.lib.stride_tricks.as_strided(raw.view(dtype), shape, strides, subok=True,
+                                               writeable=False)
+    _, name, dtype, shape = handle
+    # The worker shares the parent's resource tracker, and the parent unlinks the block.
+    shm = shared_memory.SharedMemory(name=name)
+    opened.append(shm)
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
 def _solve_entry(
     q: "mp.Queue[Tuple[str, Any]]",
+    result_name: str,
     module_name: str,
-    base_vectors: np.ndarray,
-    query_vectors: np.ndarray,
+    base_vectors: Any,
+    query_vectors: Any,
     k: int,
     K: int,
     time_budget: float,
 ) -> None:
+    opened: list = []
     try:
+        if isinstance(base_vectors, tuple):
+            base_vectors = _import_array(base_vectors, opened)
+            query_vectors = _import_array(query_vectors, opened)
         mod = importlib.import_module(module_name)
         solve = getattr(mod, "solve")
         out = solve(base_vectors, query_vectors, k, K, time_budget)
-        q.put(("ok", out))
+        result = shared_memory.SharedMemory(name=result_name)
+        opened.append(result)
+        np.ndarray(K, dtype=np.int64, buffer=result.buf)[:] = normalize_student_output(out, K)
+        q.put(("ok", None))
     except Exception as e:
         q.put(("err", e))
+    finally:
+        base_vectors = query_vectors = None
+        for shm in opened:
+            try:
+                shm.close()
+            except BufferError:  # still referenced by arrays solve() kept alive
+                pass
 
 
 def run_solve_with_time_limit(
@@ -112,37 +199,58 @@ def run_solve_with_time_limit(
     time_limit_sec: float,
     use_fork: bool,
 ) -> Tuple[np.ndarray, float, bool]:
+    """
+    Run solve() in a child process and kill it after time_limit_sec.
+
+    Nothing large is pickled. A forked child inherits the inputs. A spawned
+    child re-opens memory-mapped inputs from their files and other inputs
+    from shared_memory copies. The ranking comes back through a shared
+    K-element int64 buffer; the queue only carries the status (or the
+    exception).
+    """
     ctx = mp.get_context("fork" if use_fork else "spawn")
     q: mp.Queue = ctx.Queue(maxsize=1)
-    proc = ctx.Process(
-        target=_solve_entry,
-        args=(q, module_name, base_vectors, query_vectors, k, K, time_budget),
-    )
-    t0 = time.perf_counter()
-    proc.start()
-    proc.join(timeout=time_limit_sec)
-    elapsed = time.perf_counter() - t0
-
-    if proc.is_alive():
-        proc.terminate()
-        proc.join(timeout=5.0)
+    owned: list = []
+    try:
+        result = shared_memory.SharedMemory(create=True, size=max(1, 8 * K))
+        owned.append(result)
+        if use_fork:
+            inputs = (base_vectors, query_vectors)
+        else:
+            inputs = (_export_array(base_vectors, owned), _export_array(query_vectors, owned))
+        proc = ctx.Process(
+            target=_solve_entry,
+            args=(q, result.name, module_name, *inputs, k, K, time_budget),
+        )
+        t0 = time.perf_counter()
+        proc.start()
+        proc.join(timeout=time_limit_sec)
+        elapsed = time.perf_counter() - t0
+
+        if proc.is_alive():
+            proc.terminate()
+            proc.join(timeout=5.0)
+            print(
+                f"WARNING: time limit ({time_limit_sec}s) exceeded; no valid result returned.",
+                file=sys.stderr,
+            )
+            return normalize_student_output(None, K), elapsed, True
+
+        if not q.empty():
+            status, payload = q.get()
+            if status == "err":
+                raise payload
+            return np.ndarray(K, dtype=np.int64, buffer=result.buf).copy(), elapsed, False
+
         print(
-            f"WARNING: time limit ({time_limit_sec}s) exceeded; no valid result returned.",
+            "WARNING: worker exited without result (crashed or killed).",
             file=sys.stderr,
         )
         return normalize_student_output(None, K), elapsed, True
-
-    if not q.empty():
-        status, payload = q.get()
-        if status == "err":
-            raise payload
-        return normalize_student_output(payload, K), elapsed, False
-
-    print(
-        "WARNING: worker exited without result (crashed or killed).",
-        file=sys.stderr,
-    )
-    return normalize_student_output(None, K), elapsed, True
+    finally:
+        for shm in owned:
+            shm.close()
+            shm.unlink()
 
 
 def write_indices(path: Path, indices: np.ndarray) -> None:
@@ -190,6 +298,11 @@ def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
         action="store_true",
         help="Run solve in-process (no hard wall-clock kill; faster for huge arrays)",
     )
+    p.add_argument(
+        "--spawn",
+        action="store_true",
+        help="Start the solve worker with spawn instead of fork (inputs shared via files/shared memory)",
+    )
     p.add_argument(
         "--transpose",
         action="store_true",
@@ -215,8 +328,9 @@ def main(argv: Optional[list[str]] = None) -> int:
     base = load_vector_matrix(args.base_vectors, mmap=args.mmap)
     query = load_vector_matrix(args.query_vectors, mmap=args.mmap)
     if args.transpose:
-        base = np.ascontiguousarray(base.T)
-        query = np.ascontiguousarray(query.T)
+        # With --mmap the transpose stays a view of the mapped file.
+        base = base.T if args.mmap else np.ascontiguousarray(base.T)
+        query = query.T if args.mmap else np.ascontiguousarray(query.T)
     db, dq = int(base.shape[1]), int(query.shape[1])
     if db != dq:
         raise ValueError(
@@ -232,7 +346,7 @@ def main(argv: Optional[list[str]] = None) -> int:
     importlib.invalidate_caches()
     mod_name = args.submission_module
 
-    use_fork = sys.platform != "win32" and not args.no_subprocess
+    use_fork = sys.platform != "win32" and not args.no_subprocess and not args.spawn
     if args.no_subprocess:
         t0 = time.perf_counter()
         mod = importlib.import_module(mod_name)
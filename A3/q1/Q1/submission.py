@@ -1,10 +1,732 @@
 import os
 import sys
+import json
 import time
+import socket
+import hashlib
 
 import numpy as np
 
 
+def _base_fingerprint(base, sample_rows=1024):
+    """
+    Cheap identity of a base matrix: shape, dtype and a hash of up to
+    `sample_rows` evenly spaced rows (always including the first and last).
+    Edits confined to unsampled rows are not detected.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((base.shape, str(base.dtype))).encode())
+    if len(base):
+        rows = np.unique(np.linspace(0, len(base) - 1, min(len(base), sample_rows)).astype(np.int64))
+        h.update(np.ascontiguousarray(base[rows]).tobytes())
+    return h.hexdigest()
+
+
+def _index_cache_path(cache_dir, base, kind, params):
+    """Cache file for an index of `kind` built with `params` on `base`."""
+    import faiss
+
+    key = repr((_base_fingerprint(base), kind, sorted(params.items()), faiss.__version__))
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, f"{kind}-{digest}.faiss")
+
+
+def _read_cached_index(path):
+    """Memory-mapped read of a cached index (plain read if mmap is unsupported)."""
+    import faiss
+
+    for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        if hasattr(faiss, flag):
+            try:
+                return faiss.read_index(path, getattr(faiss, flag))
+            except RuntimeError:
+                pass
+    return faiss.read_index(path)
+
+
+def _topk_margin(counts, K, order_too=False):
+    """
+    How many more queries the current top-K of `counts` is guaranteed to survive.
+
+    A query adds at most 1 to any item, so after R more queries an item's
+    count lies in [c, c + R]. Ranking is by count descending, ties by index
+    ascending (stable argsort of -counts), so item a stays ahead of b in every
+    outcome iff c_a - c_b - [a > b] >= R. The margin is the minimum of that
+    left-hand side over the K-th item against the strongest outsider (top-K
+    membership) and, with order_too, over every adjacent pair inside the
+    top-K (the full ranking).
+    """
+    N = len(counts)
+    if K <= 0 or (K >= N and not order_too):
+        return np.inf
+    K = min(K, N)
+    kth = np.partition(counts, N - K)[N - K]
+    cand = np.flatnonzero(counts >= kth)
+    order = cand[np.argsort(-counts[cand], kind="stable")]
+    top = order[:K]
+
+    def margin(a, b):
+        return counts[a] - counts[b] - (a > b)
+
+    if len(order) > K:
+        out = order[K]
+    elif K < N:
+        below = counts < kth
+        out = np.flatnonzero(below & (counts == counts[below].max()))[0]
+    else:
+        out = None
+
+    m = np.inf if out is None else margin(top[-1], out)
+    if order_too and K > 1:
+        m = min(m, margin(top[:-1], top[1:]).min())
+    return m
+
+
+def _count_bounds(counts, S, Q, z):
+    """
+    Confidence bounds on every item's count over all Q queries from its
+    count over a uniform sample of S of them (without replacement).
+
+    A query hits an item at most once, so the hit rate is a proportion; its
+    normal interval uses the finite-population correction and the Wilson
+    centre (c + z^2/2) / (S + z^2), so items never hit in the sample still
+    get a positive upper bound. Bounds are clipped to [counts, counts + Q - S].
+    """
+    p = (counts + z * z / 2) / (S + z * z)
+    fpc = (Q - S) / max(Q - 1, 1)
+    half = z * np.sqrt(p * (1 - p) / (S + z * z) * fpc)
+    lo = np.clip(Q * (p - half), counts, counts + Q - S)
+    hi = np.clip(Q * (p + half), counts, counts + Q - S)
+    return lo, hi
+
+
+def _boundary_items(lo, hi, K):
+    """
+    Items whose interval straddles the K-th place: neither surely inside the
+    top-K (lower bound above the (K+1)-th largest upper bound) nor surely
+    outside (upper bound below the K-th largest lower bound).
+    """
+    N = len(lo)
+    if K >= N:
+        return np.arange(N)
+    hi_next = np.partition(hi, N - K - 1)[N - K - 1]
+    lo_kth = np.partition(lo, N - K)[N - K]
+    return np.flatnonzero((lo <= hi_next) & (hi >= lo_kth))
+
+
+def _reach_test(index, kind, base, items, k, anchors=None, anchor_ids=None, n_anchors=8):
+    """
+    Function mapping a query batch to a mask of the queries that can have
+    one of `items` among their k results; every other query leaves those
+    items' counts unchanged.
+
+    ivf / ivfpq: the query probes the inverted list holding an item (the
+    same coarse search the index runs, so this is exact for its results).
+    flat: the item is no farther than the k-th closest of the base points
+    found by the n_anchors sampled queries (`anchors`, with neighbour ids
+    `anchor_ids`) nearest to the query. Those are real base points, so this
+    is an upper bound on the query's true k-th NN distance; only the rows
+    of `items` and the gathered candidates are read from base.
+    hnsw (or flat without anchors): no cheap test, so every query counts.
+    """
+    import faiss
+
+    if kind in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        lists = np.zeros(ivf.nlist, dtype=bool)
+        wanted = np.zeros(ivf.ntotal, dtype=bool)
+        wanted[items] = True
+        for l in range(ivf.nlist):
+            n = ivf.invlists.list_size(l)
+            if n:
+                lists[l] = wanted[faiss.rev_swig_ptr(ivf.invlists.get_ids(l), n)].any()
+
+        def test(qs):
+            if isinstance(index, faiss.IndexPreTransform):
+                for i in range(index.chain.size()):
+                    qs = faiss.downcast_VectorTransform(index.chain.at(i)).apply(qs)
+            probes = ivf.quantizer.search(np.ascontiguousarray(qs), ivf.nprobe)[1]
+            return lists[np.maximum(probes, 0)].any(axis=1)
+        return test
+
+    if kind == "flat" and anchors is not None and len(anchors):
+        d = base.shape[1]
+        near = faiss.IndexFlatL2(d)
+        near.add(np.ascontiguousarray(base[np.sort(items)], dtype=np.float32))
+        lookup = faiss.IndexFlatL2(d)
+        lookup.add(np.ascontiguousarray(anchors, dtype=np.float32))
+        n_anchors = min(n_anchors, len(anchors))
+
+        def test(qs):
+            out = np.empty(len(qs), dtype=bool)
+            for s in range(0, len(qs), 8192):
+                part = qs[s:s + 8192]
+                cand = np.sort(anchor_ids[lookup.search(part, n_anchors)[1]].reshape(len(part), -1), axis=1)
+                # Repeated or missing (-1) candidates must not count twice.
+                skip = cand < 0
+                skip[:, 1:] |= cand[:, 1:] == cand[:, :-1]
+                flat = np.unique(cand[~skip])
+                rows = np.searchsorted(flat, np.maximum(cand, 0))
+                diff = np.asarray(base[flat], dtype=np.float32)[rows] - part[:, None, :]
+                dist = np.einsum("qcd,qcd->qc", diff, diff)
+                dist[skip] = np.inf
+                kth = np.partition(dist, k - 1, axis=1)[:, k - 1] if dist.shape[1] >= k \
+                    else np.full(len(part), np.inf, dtype=np.float32)
+                closest = near.search(part, 1)[0][:, 0]
+                out[s:s + len(part)] = closest <= kth * (1 + 1e-4) + 1e-6
+            return out
+        return test
+
+    return lambda qs: np.ones(len(qs), dtype=bool)
+
+
+def _merge_topk(q_ids, b_ids, dist, k):
+    """
+    The k closest distinct candidates of every query from (query, base,
+    squared distance) triples, as the same triples sorted by query and
+    distance (ties by base id).
+    """
+    order = np.lexsort((dist, b_ids, q_ids))
+    q_ids, b_ids, dist = q_ids[order], b_ids[order], dist[order]
+    first = np.r_[True, (q_ids[1:] != q_ids[:-1]) | (b_ids[1:] != b_ids[:-1])]
+    q_ids, b_ids, dist = q_ids[first], b_ids[first], dist[first]
+    order = np.lexsort((b_ids, dist, q_ids))
+    q_ids, b_ids, dist = q_ids[order], b_ids[order], dist[order]
+    rank = np.arange(len(q_ids)) - np.searchsorted(q_ids, q_ids, side="left")
+    keep = rank < k
+    return q_ids[keep], b_ids[keep], dist[keep]
+
+
+def _reverse_knn_counts(base, queries, k, batch=65536, first_nprobe=4, nprobe=8, seed=0, check=None):
+    """
+    Neighbour counts computed from the base side, for Q >> N.
+
+    1. A cheap first pass (IVFFlat over base, first_nprobe lists) gives
+       every query k real base points; the k-th of their distances r_q is
+       an upper bound on its true k-th NN distance.
+    2. Queries are lifted to (q, sqrt(R - r_q^2)) and base vectors to
+       (b, 0), with R = max r_q^2, so ||b' - q'||^2 <= R exactly when
+       ||b - q|| <= r_q. One fixed-radius range search per base vector
+       over an IVFFlat of the lifted queries (nprobe lists) then finds the
+       queries that can have b among their k-NN, so the searches scale with
+       N instead of Q.
+    3. Per query, the k closest of the first-pass points and range-search
+       hits are its neighbours.
+
+    Exact up to the lists the range search does not probe. With `check`
+    (query row ids), returns (counts, recall): the fraction of those
+    queries' exact k-NN (brute force over base chunks) that were found.
+    """
+    import faiss
+
+    N, d = base.shape
+    Q = len(queries)
+    rng = np.random.default_rng(seed)
+
+    def ivf_over(n, dim, rows):
+        """IVFFlat with sqrt(n) lists, trained on rows(sorted sample of indices)."""
+        nlist = max(1, int(np.sqrt(n)))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist, faiss.METRIC_L2)
+        index.cp.niter = 10
+        index.train(rows(np.sort(rng.choice(n, min(n, 40 * nlist), replace=False))))
+        return index
+
+    coarse = ivf_over(N, d, lambda idx: np.ascontiguousarray(base[idx], dtype=np.float32))
+    _add_in_chunks(coarse, base, batch)
+    coarse.nprobe = first_nprobe
+    first_d = np.empty((Q, k), dtype=np.float32)
+    first_i = np.empty((Q, k), dtype=np.int64)
+    for s in range(0, Q, batch):
+        first_d[s:s + batch], first_i[s:s + batch] = coarse.search(_rows(queries, s, s + batch), k)
+    del coarse
+    short = np.flatnonzero(first_i[:, -1] < 0)
+    if len(short):
+        # Probed lists held fewer than k points: fall back to exact search.
+        exact = faiss.IndexFlatL2(d)
+        _add_in_chunks(exact, base, batch)
+        first_d[short], first_i[short] = exact.search(
+            np.ascontiguousarray(queries[short], dtype=np.float32), k)
+        del exact
+
+    r2 = first_d[:, -1].astype(np.float64)
+    R = float(r2.max()) if Q else 0.0
+    lift = np.sqrt(np.maximum(R - r2, 0.0)).astype(np.float32)
+    lifted = ivf_over(Q, d + 1, lambda idx: np.hstack(
+        [np.asarray(queries[idx], dtype=np.float32), lift[idx, None]]))
+    for s in range(0, Q, batch):
+        lifted.add(np.hstack([_rows(queries, s, s + batch), lift[s:s + batch, None]]))
+    lifted.nprobe = nprobe
+
+    q_ids = [np.repeat(np.arange(Q, dtype=np.int64), k)]
+    b_ids = [first_i.ravel()]
+    dist = [first_d.ravel().astype(np.float64)]
+    zero = np.zeros((1, 1), dtype=np.float32)
+    for s in range(0, N, batch):
+        chunk = _rows(base, s, s + batch)
+        lims, D, I = lifted.range_search(np.hstack([chunk, np.broadcast_to(zero, (len(chunk), 1))]),
+                                         R * (1 + 1e-5) + 1e-6)
+        b = s + np.repeat(np.arange(len(chunk), dtype=np.int64), np.diff(lims).astype(np.int64))
+        q_ids.append(I.astype(np.int64))
+        b_ids.append(b)
+        dist.append(D - (R - r2[I]))
+    q_ids, b_ids, dist = _merge_topk(np.concatenate(q_ids), np.concatenate(b_ids),
+                                     np.concatenate(dist), k)
+    counts = np.bincount(b_ids, minlength=N)
+    if check is None:
+        return counts
+
+    check = np.sort(check)
+    xq = np.ascontiguousarray(queries[check], dtype=np.float32)
+    found = [[], [], []]
+    for s in range(0, N, batch):
+        D, I = faiss.knn(xq, _rows(base, s, s + batch), k)
+        found[0].append(np.repeat(np.arange(len(check), dtype=np.int64), k))
+        found[1].append(I.ravel() + s)
+        found[2].append(D.ravel().astype(np.float64))
+    eq, eb, _ed = _merge_topk(*(np.concatenate(f) for f in found), k)
+    sel = np.isin(q_ids, check)
+    got = set(zip(q_ids[sel].tolist(), b_ids[sel].tolist()))
+    hits = sum((int(check[q]), int(b)) in got for q, b in zip(eq.tolist(), eb.tolist()))
+    return counts, hits / max(len(eq), 1)
+
+
+def _pipelined_counts(base, queries, k, kind, params, chunk, batch, remaining, log_stage):
+    """
+    Neighbour counts for kind "flat" or "ivf" with build and search overlapped.
+
+    Three stages run at once: a thread converts base chunks to float32 (at
+    most two ahead), the caller's thread trains the IVF quantizer on a sample
+    and then adds each chunk to its own shard (a clone of the trained empty
+    index, so all shards share the coarse lists), and a second thread searches
+    every query against the finished shards one by one, merging each shard's
+    results into a running per-query top-k.
+
+    For IVF, the coarse quantizer runs once per query batch, on the first
+    shard's pass, and its (Q, nprobe) assignment is kept. Every shard then
+    scans the same probed lists with search_preassigned. Because all shards
+    share the quantizer, the merged top-k equals what one index over all of
+    base returns at that nprobe. nprobe follows the unpipelined pilot rule:
+    per-nprobe cost = (pilot quantizer time + pilot scan time of the first
+    shard x number of shards) / 8, scaled to Q. `remaining()` is the budget
+    left in seconds.
+    """
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+
+    import faiss
+
+    N, d = base.shape
+    Q = len(queries)
+    starts = list(range(0, N, chunk))
+    ready = queue.Queue(maxsize=2)
+
+    def convert():
+        for s in starts:
+            ready.put((s, _rows(base, s, s + chunk)))
+
+    best_d = np.full((Q, k), np.inf, dtype=np.float32)
+    best_i = np.full((Q, k), -1, dtype=np.int64)
+
+    coarse = {}
+
+    def search_shard(shard, offset):
+        for b in range(0, Q, batch):
+            qs = _rows(queries, b, b + batch)
+            if kind == "ivf":
+                if b not in coarse:
+                    coarse[b] = shard.quantizer.search(qs, shard.nprobe)
+                Dq, Iq = coarse[b]
+                D, I = shard.search_preassigned(qs, k, Iq, Dq)
+            else:
+                D, I = shard.search(qs, k)
+            D = np.hstack([best_d[b:b + batch], D])
+            I = np.hstack([best_i[b:b + batch], np.where(I >= 0, I + offset, -1)])
+            order = np.argsort(D, axis=1, kind="stable")[:, :k]
+            best_d[b:b + batch] = np.take_along_axis(D, order, axis=1)
+            best_i[b:b + batch] = np.take_along_axis(I, order, axis=1)
+
+    with ThreadPoolExecutor(2) as pool:
+        converting = pool.submit(convert)
+        try:
+            p_time = time.perf_counter()
+            if kind == "ivf":
+                template = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, params["nlist"], faiss.METRIC_L2)
+                rng = np.random.default_rng(params["seed"])
+                sample = np.sort(rng.choice(N, params["train_size"], replace=False))
+                template.train(np.ascontiguousarray(base[sample], dtype=np.float32))
+            else:
+                template = faiss.IndexFlatL2(d)
+            log_stage("pipeline_train", time.perf_counter() - p_time)
+
+            nprobe = None
+            searching = None
+            add_seconds = 0.0
+            for _ in starts:
+                offset, x = ready.get()
+                p_add = time.perf_counter()
+                shard = faiss.clone_index(template)
+                shard.add(x)
+                add_seconds += time.perf_counter() - p_add
+                if kind == "ivf":
+                    if nprobe is None:
+                        # The unpipelined pilot times one search over all of
+                        # base; here the quantizer runs once and the scan of
+                        # the first shard stands for 1 / len(starts) of it.
+                        pilot = min(Q, 50)
+                        qs = _rows(queries, 0, pilot)
+                        p_probe = time.perf_counter()
+                        Dq, Iq = shard.quantizer.search(qs, 8)
+                        p_scan = time.perf_counter()
+                        shard.nprobe = 8
+                        shard.search_preassigned(qs, k, Iq, Dq)
+                        done = time.perf_counter()
+                        pilot_seconds = (p_scan - p_probe) + (done - p_scan) * len(starts)
+                        t_per_nprobe = pilot_seconds / 8 * (Q / max(pilot, 1))
+                        nprobe = int(np.clip((remaining() - 0.75) / max(t_per_nprobe, 1e-3), 8, 32))
+                        nprobe = min(nprobe, params["nlist"])
+                        log_stage("nprobe_selected", float(nprobe))
+                    shard.nprobe = nprobe
+                if searching is not None:
+                    searching.result()
+                searching = pool.submit(search_shard, shard, offset)
+            if searching is not None:
+                searching.result()
+            log_stage("pipeline_add", add_seconds)
+        finally:
+            # Unblock the converter if the pipeline stopped early.
+            while not converting.done():
+                try:
+                    ready.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        converting.result()
+
+    flat = best_i.ravel()
+    return np.bincount(flat[flat >= 0], minlength=N)
+
+
+def _available_memory():
+    """Bytes of RAM currently available (MemAvailable on Linux), or None."""
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _index_memory(kind, N, d, params):
+    """Rough resident size in bytes of an index of `kind` over N vectors."""
+    if kind == "flat":
+        return 4 * N * d
+    if kind == "hnsw":
+        # Full vectors plus 2*M int32 level-0 links; upper levels add ~10%.
+        return int(1.1 * N * (4 * d + 8 * params["M"]))
+    if kind == "ivf":
+        return N * (4 * d + 8) + 4 * params["nlist"] * d
+    # ivfpq: m one-byte codes + int64 id per vector, coarse and PQ centroids,
+    # and the OPQ rotation.
+    d_pq = 4 * params["m"]
+    return (N * (params["m"] + 8) + 4 * params["nlist"] * d_pq + 4 * 256 * d_pq
+            + (4 * d * d_pq if params["opq"] else 0))
+
+
+def _pq_subquantizers(d):
+    """
+    ceil(d / 4) sub-quantizers: one byte per 4 dimensions of the vectors
+    zero-padded to 4 m dimensions (padding leaves L2 distances unchanged),
+    so a prime or near-prime d does not collapse to one or two codes.
+    """
+    return max(1, -(-d // 4))
+
+
+def _rerank_exact(base, queries, cand, k, block=1024):
+    """
+    Keep the k candidates of each query that are closest in exact L2.
+
+    Candidate rows are gathered from `base` (which may be memory-mapped) one
+    block of queries at a time, in sorted row order for locality. Ties keep
+    the order of the approximate search; missing candidates (-1) stay last.
+    """
+    out = np.full((len(queries), k), -1, dtype=np.int64)
+    for s in range(0, len(queries), block):
+        c = cand[s:s + block]
+        valid = c >= 0
+        uniq, inv = np.unique(np.where(valid, c, 0).ravel(), return_inverse=True)
+        vecs = np.asarray(base[uniq], dtype=np.float32)[inv.ravel()].reshape(c.shape + (-1,))
+        dist = ((vecs - queries[s:s + block, None, :]) ** 2).sum(axis=-1)
+        dist[~valid] = np.inf
+        order = np.argsort(dist, axis=1, kind="stable")[:, :k]
+        keep = np.isfinite(np.take_along_axis(dist, order, axis=1))
+        out[s:s + len(c), :order.shape[1]] = np.where(keep, np.take_along_axis(c, order, axis=1), -1)
+    return out
+
+
+_HNSW_EF = (16, 32, 64, 128)
+# HNSW build settings of the calibration; planned HNSW builds use the same.
+_HNSW_M = 12
+_HNSW_EF_CONSTRUCTION = 40
+_IVF_PROBES = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _rows(X, start, stop):
+    """Rows start:stop of X as a C-contiguous float32 copy (X may be memory-mapped)."""
+    return np.ascontiguousarray(X[start:stop], dtype=np.float32)
+
+
+def _add_in_chunks(index, base, chunk):
+    """index.add(base) one `chunk`-row slice at a time, so at most one chunk is copied."""
+    for s in range(0, len(base), chunk):
+        index.add(_rows(base, s, s + chunk))
+
+
+def _cost_model_key(d):
+    import faiss
+
+    return f"{socket.gethostname()}|cpus={os.cpu_count()}|omp={faiss.omp_get_max_threads()}|faiss={faiss.__version__}|d={d}"
+
+
+def _calibrate(base, queries, k, n_cal=10_000, q_cal=200, seed=0):
+    """
+    Micro-benchmarks on a sample of the data, as per-unit costs in seconds:
+
+      flat        per (query x base vector x dim) of exact search
+      hnsw_add    per (vector x efConstruction x log2 n) inserted, M=12
+      hnsw_search per (query x efSearch x log2 n)
+      ivf_train   per (training point x list x dim) of coarse k-means
+      ivf_assign  per (vector x list x dim) of coarse assignment (add, search)
+      ivf_scan    per (scanned vector x dim) of list scanning
+
+    plus recall@k against exact search for each efSearch in _HNSW_EF and each
+    probed fraction nprobe / nlist in _IVF_PROBES.
+    """
+    import faiss
+
+    rng = np.random.default_rng(seed)
+    n, d = min(len(base), n_cal), base.shape[1]
+    S = np.ascontiguousarray(base[np.sort(rng.choice(len(base), n, replace=False))], dtype=np.float32)
+    q = np.ascontiguousarray(queries[rng.choice(len(queries), min(len(queries), q_cal), replace=False)],
+                             dtype=np.float32)
+    nq, kk = len(q), min(k, n)
+    logn = np.log2(max(n, 2))
+
+    def recall(I):
+        return float(np.mean([len(np.intersect1d(a, b)) / kk for a, b in zip(I, gt)]))
+
+    flat = faiss.IndexFlatL2(d)
+    flat.add(S)
+    p = time.perf_counter()
+    gt = flat.search(q, kk)[1]
+    model = {"flat": (time.perf_counter() - p) / (nq * n * d)}
+
+    ef_construction = _HNSW_EF_CONSTRUCTION
+    hnsw = faiss.IndexHNSWFlat(d, _HNSW_M)
+    hnsw.hnsw.efConstruction = ef_construction
+    p = time.perf_counter()
+    hnsw.add(S)
+    model["hnsw_add"] = (time.perf_counter() - p) / (n * ef_construction * logn)
+    cost, model["recall_hnsw"] = [], {}
+    for ef in _HNSW_EF:
+        hnsw.hnsw.efSearch = ef
+        p = time.perf_counter()
+        I = hnsw.search(q, kk)[1]
+        cost.append((time.perf_counter() - p) / (nq * ef * logn))
+        model["recall_hnsw"][str(ef)] = recall(I)
+    model["hnsw_search"] = float(np.median(cost))
+
+    nlist = max(8, int(np.sqrt(n)))
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, nlist, faiss.METRIC_L2)
+    train = S[:min(n, 40 * nlist)]
+    p = time.perf_counter()
+    ivf.train(train)
+    model["ivf_train"] = (time.perf_counter() - p) / (len(train) * nlist * d)
+    p = time.perf_counter()
+    ivf.add(S)
+    model["ivf_assign"] = (time.perf_counter() - p) / (n * nlist * d)
+    cost, model["recall_ivf"] = [], {}
+    for nprobe in _IVF_PROBES:
+        if nprobe > nlist:
+            break
+        ivf.nprobe = nprobe
+        p = time.perf_counter()
+        I = ivf.search(q, kk)[1]
+        secs = time.perf_counter() - p - model["ivf_assign"] * nq * nlist * d
+        cost.append(max(secs, 0.0) / (nq * n * nprobe / nlist * d))
+        model["recall_ivf"][str(nprobe / nlist)] = recall(I)
+    model["ivf_scan"] = float(np.median(cost))
+    return model
+
+
+def _load_cost_model(path, base, queries, k):
+    """This host's calibration from the JSON cache at `path`, calibrating on a miss."""
+    key = _cost_model_key(base.shape[1])
+    try:
+        with open(path) as fh:
+            models = json.load(fh)
+    except (OSError, ValueError):
+        models = {}
+    if key not in models:
+        models[key] = _calibrate(base, queries, k)
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump(models, fh, indent=2, sort_keys=True)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return models[key]
+
+
+def _plan_with_cost_model(model, N, Q, d, seconds, nlist_scale=1.0):
+    """
+    Index plan with the highest calibrated recall whose predicted build +
+    search time fits in `seconds` (ties: fastest); the fastest plan if none
+    fits. Returns a dict with kind, predicted seconds and recall, and
+    M / efConstruction / efSearch (hnsw) or nlist / nprobe (ivf).
+    """
+    logN = np.log2(max(N, 2))
+    plans = [{"kind": "flat", "seconds": model["flat"] * Q * N * d, "recall": 1.0}]
+
+    # Priced (and, in solve, built) with the calibrated M / efConstruction,
+    # so the build time and the recall table describe the index actually built.
+    hnsw_build = model["hnsw_add"] * N * _HNSW_EF_CONSTRUCTION * logN
+    for ef, rec in model["recall_hnsw"].items():
+        plans.append({"kind": "hnsw", "efSearch": int(ef), "recall": rec,
+                      "M": _HNSW_M, "efConstruction": _HNSW_EF_CONSTRUCTION,
+                      "seconds": hnsw_build + model["hnsw_search"] * Q * int(ef) * logN})
+
+    fracs = sorted((float(f), r) for f, r in model["recall_ivf"].items())
+    for scale in (0.5, 1.0, 2.0):
+        nlist = int(np.clip(np.sqrt(N) * nlist_scale * scale, 64, 4096))
+        build = (model["ivf_train"] * min(N, 40 * nlist) * nlist * d
+                 + model["ivf_assign"] * N * nlist * d)
+        for nprobe in sorted({min(nlist, max(1, int(round(f * nlist)))) for f, _ in fracs}):
+            frac = nprobe / nlist
+            rec = float(np.interp(frac, [f for f, _ in fracs], [r for _, r in fracs]))
+            plans.append({"kind": "ivf", "nlist": nlist, "nprobe": nprobe, "recall": rec,
+                          "seconds": build + model["ivf_assign"] * Q * nlist * d
+                                     + model["ivf_scan"] * Q * frac * N * d})
+
+    fits = [p for p in plans if p["seconds"] <= seconds]
+    if not fits:
+        return min(plans, key=lambda p: p["seconds"])
+    return max(fits, key=lambda p: (p["recall"], -p["seconds"]))
+
+
+def _index_params(kind, N, d, budget, nlist_scale=1.0, use_opq=False, nlist=None):
+    """
+    Build parameters solve() uses for an index of `kind` over N x d vectors;
+    `nlist` overrides the sqrt(N)-based list count (training size follows it).
+    """
+    if kind == "flat":
+        return {}
+    if kind == "hnsw":
+        if budget >= 60:
+            ef_construction = 96
+        elif budget >= 30:
+            ef_construction = 64
+        else:
+            ef_construction = 48
+        return {"M": 12, "efConstruction": ef_construction}
+    if kind == "ivf":
+        if nlist is None:
+            nlist = int(np.clip(np.sqrt(N) * nlist_scale, 64, 1024))
+        return {"nlist": nlist, "train_size": min(N, 40 * nlist), "seed": 42}
+    # PQ codebooks need ~40 * 256 training points besides the coarse lists.
+    if nlist is None:
+        nlist = int(np.clip(np.sqrt(N) * nlist_scale, 64, 4096))
+    return {"nlist": nlist, "m": _pq_subquantizers(d), "opq": use_opq,
+            "train_size": min(N, max(40 * nlist, 40 * 256)), "seed": 42}
+
+
+def _build_index(kind, params, base, add_batch=65536, log_stage=None):
+    """A trained, filled index of `kind` over base (which may be memory-mapped)."""
+    import faiss
+
+    N, d = base.shape
+    if kind == "flat":
+        index = faiss.IndexFlatL2(d)
+        _add_in_chunks(index, base, add_batch)
+        return index
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, params["M"])
+        index.hnsw.efConstruction = params["efConstruction"]
+        _add_in_chunks(index, base, add_batch)
+        return index
+
+    rng = np.random.default_rng(params["seed"])
+    if kind == "ivf":
+        quantizer = faiss.IndexFlatL2(d)
+        index = faiss.IndexIVFFlat(quantizer, d, params["nlist"], faiss.METRIC_L2)
+    else:
+        # Short k-means runs on <= 256 * 64 points per codebook: PQ
+        # training otherwise dominates the build, and exact re-ranking
+        # absorbs the small loss in code quality. The PQ works on
+        # d_pq = 4 m dimensions: OPQ projects to them, otherwise the
+        # vectors are zero-padded.
+        d_pq = 4 * params["m"]
+        quantizer = faiss.IndexFlatL2(d_pq)
+        ivfpq = faiss.IndexIVFPQ(quantizer, d_pq, params["nlist"], params["m"], 8)
+        ivfpq.pq.cp.niter = 10
+        ivfpq.pq.cp.max_points_per_centroid = 64
+        index = ivfpq
+        if params["opq"]:
+            opq = faiss.OPQMatrix(d, params["m"], d_pq)
+            opq.niter = 10
+            opq.max_train_points = 256 * 64
+            index = faiss.IndexPreTransform(opq, ivfpq)
+        elif d_pq != d:
+            index = faiss.IndexPreTransform(faiss.RemapDimensionsTransform(d, d_pq, True), ivfpq)
+
+    p_train = time.perf_counter()
+    sample = np.sort(rng.choice(N, params["train_size"], replace=False))
+    index.train(np.ascontiguousarray(base[sample], dtype=np.float32))
+    if log_stage is not None:
+        log_stage("index_train", time.perf_counter() - p_train)
+
+    p_add = time.perf_counter()
+    _add_in_chunks(index, base, add_batch)
+    if log_stage is not None:
+        log_stage("index_add", time.perf_counter() - p_add)
+    return index
+
+
+def _set_search_param(index, kind, value):
+    """efSearch (hnsw) or nprobe (ivf, ivfpq); flat has none."""
+    import faiss
+
+    if kind == "hnsw":
+        index.hnsw.efSearch = int(value)
+    elif kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = int(value)
+
+
+def _knn_search(index, kind, base, qs, k, rerank=4):
+    """(len(qs), k) neighbour ids; PQ candidates are re-ranked exactly."""
+    if kind != "ivfpq":
+        return index.search(qs, k)[1]
+    out = np.empty((len(qs), k), dtype=np.int64)
+    for s in range(0, len(qs), 65536):
+        _dist, cand = index.search(qs[s:s + 65536], k * rerank)
+        out[s:s + 65536] = _rerank_exact(base, qs[s:s + 65536], cand, k)
+    return out
+
+
+def _write_cached_index(index, path):
+    import faiss
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
 def solve(base_vectors, query_vectors, k, K, time_budget):
     """
     Returns the K most representative database items.
@@ -24,6 +746,95 @@ def solve(base_vectors, query_vectors, k, K, time_budget):
       below the time budget.
     - Otherwise                 : lightweight IndexIVFFlat fallback with a
       smaller coarse quantizer and no probe calibration.
+    - Memory-bound              : if the estimated size of the chosen index
+      exceeds the memory budget (Q1_MEM_BUDGET_GB, default 80% of available
+      RAM), IVF-PQ (OPQ+IVF-PQ with Q1_OPQ=1) with one-byte codes per ~4
+      dimensions. Each query fetches k * Q1_RERANK (default 4) PQ candidates
+      and keeps the k closest by exact distance to base_vectors, which may
+      stay memory-mapped.
+
+    Q1_INDEX=flat|hnsw|ivf|ivfpq forces the index type.
+
+    Calibrated cost model
+    ---------------------
+    With Q1_COST_MODEL=1 (cache at ~/.cache/q1_cost_model.json) or
+    Q1_COST_MODEL=<path>, the fixed thresholds above are replaced by
+    per-unit costs measured on this host: flat search throughput, HNSW
+    insertion and search cost, IVF training, assignment and list-scan cost,
+    plus the recall each efSearch / probed fraction reaches, all measured on
+    a 10k-row sample of the data (see _calibrate). The measurements are
+    cached per host, thread count, faiss version and dimension, so only the
+    first call pays the ~1-2s calibration. The index type and efSearch or
+    nlist / nprobe with the highest predicted recall whose predicted build +
+    search time fits in 80% of the remaining budget are then used directly
+    (see _plan_with_cost_model). The memory check below still applies.
+
+    Streaming early stop
+    --------------------
+    With Q1_STREAM=set (or =order), queries are searched in batches of
+    Q1_STREAM_BATCH (default 16384) and counting stops as soon as the
+    remaining queries can no longer change the top-K membership (or, for
+    =order, the whole top-K ranking), see _topk_margin. =order returns
+    exactly what the full run returns; =set returns the same K items, ranked
+    by the counts seen so far with the same tie-breaking.
+
+    Reverse kNN
+    -----------
+    When exact search was chosen, Q >= 4 N and brute force (Q * N * d at
+    ~0.2 ns, or the calibrated rate with Q1_COST_MODEL) cannot finish in
+    the remaining budget, counts come from the base side instead (see
+    _reverse_knn_counts): a cheap IVF pass bounds every query's k-th NN
+    distance, and one range search per base vector over an index of the
+    lifted queries finds the queries whose k-NN can contain it. The plan
+    is approximate, so the switch is reported on stderr together with its
+    recall@k measured against brute force on 256 sampled queries.
+    Q1_RKNN=1 forces this plan, Q1_RKNN=0 disables it.
+
+    Pipelined build and search
+    --------------------------
+    With Q1_PIPELINE=1, flat and IVF runs (without Q1_INDEX_CACHE or
+    Q1_COST_MODEL) overlap their stages instead of running them in order:
+    base chunks of Q1_ADD_BATCH rows are converted in one thread while the
+    quantizer trains, each chunk becomes a shard of the trained index, and
+    each finished shard is searched in another thread while the next one is
+    added. The coarse quantizer runs once per query batch and every shard
+    scans the same probed lists (search_preassigned), so at a given nprobe
+    the merged per-query top-k lists equal those of one index over all of
+    base; nprobe comes from the unpipelined pilot rule, measured on the
+    first shard (see _pipelined_counts).
+
+    Sampled counting
+    ----------------
+    With Q1_SAMPLE=<fraction> (e.g. 0.1), only a uniform sample of the
+    queries is searched first. Each item's total count gets a confidence
+    interval (Q1_SAMPLE_CONFIDENCE, default 0.99; see _count_bounds), and
+    only the items whose interval straddles the K-th place are left open.
+    Of the remaining queries, only those that can reach an open item are
+    searched (see _reach_test), in random order, until the budget
+    runs out. Open items get their exact count when every such query was
+    searched, and an extrapolated one otherwise; the other items are ranked
+    by their sample count scaled to Q. If more than half the remaining
+    queries are needed anyway, all of them are searched and the counts are
+    exact; when more than half the sampled queries already hit an open
+    item, the reach test is skipped for that fallback. Takes precedence
+    over Q1_STREAM.
+
+    Memory-mapped inputs
+    --------------------
+    np.memmap inputs (main.py --mmap) are never copied whole: base vectors
+    are added to the index in slices of Q1_ADD_BATCH rows (default 65536),
+    queries are searched in batches of Q1_QUERY_BATCH rows (default 65536)
+    whose neighbours are counted immediately, and every slice is converted
+    to float32 on its own. Other inputs are converted once up front, as
+    before, and then go through the same batched loops.
+
+    Index cache
+    -----------
+    With Q1_INDEX_CACHE=<dir>, built indexes are written to <dir> keyed by a
+    fingerprint of base_vectors (shape, dtype, sampled-row hash) and the
+    build parameters, and later calls with the same corpus and parameters
+    read them back memory-mapped instead of rebuilding. Search-time settings
+    (efSearch, nprobe) are not part of the key and are chosen per call.
     """
     import faiss
 
@@ -33,6 +844,27 @@ def solve(base_vectors, query_vectors, k, K, time_budget):
     budget = max(0.0, float(time_budget))
     debug_timing = os.environ.get("Q1_TIMING", "0") == "1"
     ivf_nlist_scale = float(os.environ.get("Q1_IVF_NLIST_SCALE", "1.0"))
+    index_cache = os.environ.get("Q1_INDEX_CACHE") or None
+    stream = os.environ.get("Q1_STREAM", "")
+    stream_batch = max(1, int(os.environ.get("Q1_STREAM_BATCH", "16384")))
+    add_batch = max(1, int(os.environ.get("Q1_ADD_BATCH", "65536")))
+    query_batch = max(1, int(os.environ.get("Q1_QUERY_BATCH", "65536")))
+    forced_index = os.environ.get("Q1_INDEX", "")
+    cost_model = os.environ.get("Q1_COST_MODEL", "")
+    if cost_model == "1":
+        cost_model = os.path.join(os.path.expanduser("~"), ".cache", "q1_cost_model.json")
+    use_opq = os.environ.get("Q1_OPQ", "0") == "1"
+    rerank = max(1, int(os.environ.get("Q1_RERANK", "4")))
+    sample_frac = float(os.environ.get("Q1_SAMPLE") or 0)
+    pipeline = os.environ.get("Q1_PIPELINE", "0") == "1"
+    rknn = os.environ.get("Q1_RKNN") or "auto"
+    sample_conf = float(os.environ.get("Q1_SAMPLE_CONFIDENCE", "0.99"))
+    mem_budget_gb = os.environ.get("Q1_MEM_BUDGET_GB")
+    if mem_budget_gb is not None:
+        mem_budget = float(mem_budget_gb) * 2**30
+    else:
+        avail = _available_memory()
+        mem_budget = 0.8 * avail if avail is not None else float("inf")
 
     def t():
         return time.perf_counter() - start
@@ -47,19 +879,31 @@ def solve(base_vectors, query_vectors, k, K, time_budget):
 
     # ── Pre-process ────────────────────────────────────────────────────────
     p_time = time.perf_counter()
-    base    = np.ascontiguousarray(base_vectors,  dtype=np.float32)
-    queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    # Memory-mapped inputs stay on disk; slices are converted as they are used.
+    base, queries = (X if isinstance(X, np.memmap) else np.ascontiguousarray(X, dtype=np.float32)
+                     for X in (base_vectors, query_vectors))
     log_stage("preprocess", time.perf_counter() - p_time)
     log_value("N_base", float(N))
     log_value("Q_queries", float(Q))
 
     # ── Index selection ────────────────────────────────────────────────────
-    if N <= 80_000:
-        # ── Exact search ───────────────────────────────────────────────────
+    def params_for(kind):
+        return _index_params(kind, N, d, budget, ivf_nlist_scale, use_opq)
+
+    plan = model = None
+    if forced_index:
+        kind = forced_index
+    elif cost_model:
         p_time = time.perf_counter()
-        index = faiss.IndexFlatL2(d)
-        index.add(base)
-        log_stage("index_build", time.perf_counter() - p_time)
+        model = _load_cost_model(cost_model, base, queries, k)
+        plan = _plan_with_cost_model(model, N, Q, d, 0.8 * (budget - t()), ivf_nlist_scale)
+        kind = plan["kind"]
+        log_stage("cost_model", time.perf_counter() - p_time)
+        log_value("plan_seconds", plan["seconds"])
+        log_value("plan_recall", plan["recall"])
+    elif N <= 80_000:
+        # ── Exact search ───────────────────────────────────────────────────
+        kind = "flat"
     else:
         # Conservative estimate for HNSW build time. The earlier pure-HNSW
         # attempt exceeded the D2 budget, so we only use HNSW when the
@@ -68,75 +912,222 @@ def solve(base_vectors, query_vectors, k, K, time_budget):
 
         if hnsw_est_secs < 0.45 * budget:
             # ── HNSW ──────────────────────────────────────────────────────
-            p_time = time.perf_counter()
-            index = faiss.IndexHNSWFlat(d, 12)
+            kind = "hnsw"
+        else:
+            # ── Light IVF fallback ───────────────────────────────────────
+            kind = "ivf"
+    params = params_for(kind)
+    if plan is not None and kind == "ivf":
+        params.update(nlist=plan["nlist"], train_size=min(N, 40 * plan["nlist"]))
+    elif plan is not None and kind == "hnsw":
+        params.update(M=plan["M"], efConstruction=plan["efConstruction"])
 
-            if budget >= 60:
-                index.hnsw.efConstruction = 96
-            elif budget >= 30:
-                index.hnsw.efConstruction = 64
-            else:
-                index.hnsw.efConstruction = 48
+    # ── Compressed tier when the index would not fit in memory ────────────
+    mem_est = _index_memory(kind, N, d, params)
+    log_value("index_mem_est_gb", mem_est / 2**30)
+    if not forced_index and kind != "ivfpq" and mem_est > mem_budget:
+        kind = "ivfpq"
+        params = params_for(kind)
+        log_value("index_mem_est_gb", _index_memory(kind, N, d, params) / 2**30)
+    log_value(f"index_{kind}", 1.0)
 
-            index.add(base)
-            log_stage("index_build", time.perf_counter() - p_time)
+    # ── Reverse-kNN plan when queries vastly outnumber base vectors ───────
+    flat_cost = model["flat"] if model is not None else 2e-10
+    flat_seconds, left = Q * N * d * flat_cost, budget - t()
+    if rknn == "1" or (rknn == "auto" and kind == "flat" and not forced_index and Q >= 4 * N
+                       and flat_seconds > left):
+        p_search = time.perf_counter()
+        check = np.random.default_rng(0).choice(Q, min(Q, 256), replace=False)
+        counts, recall = _reverse_knn_counts(base, queries, k, query_batch, check=check)
+        log_stage("reverse_knn", time.perf_counter() - p_search)
+        log_value("rknn_recall_est", recall)
+        if rknn == "auto":
+            print(f"[solve] exact search needs ~{flat_seconds:.1f}s of {left:.1f}s left; "
+                  f"used approximate reverse kNN (recall@{k} ~{recall:.3f} on {len(check)} "
+                  f"sampled queries; Q1_RKNN=0 disables)", file=sys.stderr)
+        ranking = np.argsort(-counts, kind='stable')
+        log_stage("total_solve", t())
+        return ranking[:K].astype(np.int64)
 
-            rem = budget - t()
-            if rem > 40:
-                index.hnsw.efSearch = 96
-            elif rem > 20:
-                index.hnsw.efSearch = 64
-            else:
-                index.hnsw.efSearch = 32
+    # ── Pipelined build + search (flat / IVF, nothing to reuse) ───────────
+    if pipeline and kind in ("flat", "ivf") and index_cache is None and plan is None:
+        p_search = time.perf_counter()
+        counts = _pipelined_counts(base, queries, k, kind, params, add_batch, query_batch,
+                                   lambda: budget - t(), log_stage)
+        log_stage("pipeline", time.perf_counter() - p_search)
+        ranking = np.argsort(-counts, kind='stable')
+        log_stage("total_solve", t())
+        return ranking[:K].astype(np.int64)
+
+    # ── Index build (or cache hit) ─────────────────────────────────────────
+    p_time = time.perf_counter()
+    index = None
+    cache_path = None
+    if index_cache is not None:
+        cache_path = _index_cache_path(index_cache, base, kind, params)
+        if os.path.exists(cache_path):
+            try:
+                index = _read_cached_index(cache_path)
+                log_stage("index_cache_load", time.perf_counter() - p_time)
+            except RuntimeError:
+                index = None
+
+    if index is None:
+        index = _build_index(kind, params, base, add_batch, log_stage)
+
+        if cache_path is not None:
+            p_write = time.perf_counter()
+            try:
+                _write_cached_index(index, cache_path)
+            except (OSError, RuntimeError):
+                pass
+            log_stage("index_cache_write", time.perf_counter() - p_write)
+    log_stage("index_build", time.perf_counter() - p_time)
 
+    def search(qs):
+        return _knn_search(index, kind, base, qs, k, rerank)
+
+    # ── Search-time parameters ─────────────────────────────────────────────
+    if plan is not None and plan["kind"] == kind != "flat":
+        _set_search_param(index, kind, plan.get("efSearch", plan.get("nprobe")))
+        log_value("planned_search_param", float(plan.get("efSearch", plan.get("nprobe"))))
+
+    elif kind == "hnsw":
+        rem = budget - t()
+        if rem > 40:
+            index.hnsw.efSearch = 96
+        elif rem > 20:
+            index.hnsw.efSearch = 64
         else:
-            # ── Light IVF fallback ───────────────────────────────────────
-            p_time = time.perf_counter()
-            nlist = int(np.clip(np.sqrt(N) * ivf_nlist_scale, 64, 1024))
-            train_size = min(N, 40 * nlist)
-            rng = np.random.default_rng(42)
-
-            quantizer = faiss.IndexFlatL2(d)
-            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_L2)
-
-            p_train = time.perf_counter()
-            index.train(base[rng.choice(N, train_size, replace=False)])
-            log_stage("index_train", time.perf_counter() - p_train)
-
-            p_add = time.perf_counter()
-            index.add(base)
-            log_stage("index_add", time.perf_counter() - p_add)
-            log_stage("index_build", time.perf_counter() - p_time)
-
-            # Pilot-based probe selection keeps the fallback adaptive across
-            # different hidden datasets and runtime environments.
-            pilot_nprobe = 8
-            pilot_queries = min(Q, 50)
-            safety_margin = 0.75
-
-            index.nprobe = pilot_nprobe
-            p_probe = time.perf_counter()
-            index.search(queries[:pilot_queries], k)
-            pilot_seconds = time.perf_counter() - p_probe
-            log_stage("probe_calibration", pilot_seconds)
-
-            t_per_nprobe = (pilot_seconds / pilot_nprobe) * (Q / pilot_queries)
-            rem = budget - t() - safety_margin
-            nprobe = int(np.clip(rem / max(t_per_nprobe, 1e-3), 8, 32))
-            index.nprobe = min(nprobe, nlist)
-            log_stage("nprobe_selected", float(index.nprobe))
-
-    # ── ANN search ─────────────────────────────────────────────────────────
-    p_search = time.perf_counter()
-    _dist, I = index.search(queries, k)   # I: (Q, k) – indices of k-NNs
-    log_stage("final_search", time.perf_counter() - p_search)
-
-    # ── Frequency counting ─────────────────────────────────────────────────
-    p_count = time.perf_counter()
-    flat = I.ravel()
-    flat = flat[flat >= 0]
-    counts = np.bincount(flat, minlength=N)
-    log_stage("counting", time.perf_counter() - p_count)
+            index.hnsw.efSearch = 32
+
+    elif kind in ("ivf", "ivfpq"):
+        # Pilot-based probe selection keeps the fallback adaptive across
+        # different hidden datasets and runtime environments.
+        pilot_nprobe = 8
+        pilot_queries = min(Q, 50)
+        safety_margin = 0.75
+
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = pilot_nprobe
+        p_probe = time.perf_counter()
+        search(_rows(queries, 0, pilot_queries))
+        pilot_seconds = time.perf_counter() - p_probe
+        log_stage("probe_calibration", pilot_seconds)
+
+        t_per_nprobe = (pilot_seconds / pilot_nprobe) * (Q / pilot_queries)
+        rem = budget - t() - safety_margin
+        nprobe = int(np.clip(rem / max(t_per_nprobe, 1e-3), 8, 32))
+        ivf.nprobe = min(nprobe, params["nlist"])
+        log_stage("nprobe_selected", float(ivf.nprobe))
+
+    def count_rows(rows, counts):
+        """Search queries[rows] in batches and add their neighbours to counts."""
+        for s in range(0, len(rows), query_batch):
+            sel = np.sort(rows[s:s + query_batch])
+            flat = search(np.ascontiguousarray(queries[sel], dtype=np.float32)).ravel()
+            counts += np.bincount(flat[flat >= 0], minlength=N)
+
+    if 0 < sample_frac < 1 and Q > 0:
+        # ── Sampled counting, exact search only near the K-th boundary ─────
+        p_search = time.perf_counter()
+        from statistics import NormalDist
+
+        perm = np.random.default_rng(0).permutation(Q)
+        S = int(min(Q, max(np.ceil(sample_frac * Q), 1000)))
+        sampled, rest = np.sort(perm[:S]), perm[S:]
+        sample_ids = np.empty((S, k), dtype=np.int64)
+        for s in range(0, S, query_batch):
+            sample_ids[s:s + query_batch] = search(
+                np.ascontiguousarray(queries[sampled[s:s + query_batch]], dtype=np.float32))
+        flat = sample_ids.ravel()
+        counts = np.bincount(flat[flat >= 0], minlength=N).astype(np.int64)
+        per_query = (time.perf_counter() - p_search) / S
+
+        z = NormalDist().inv_cdf(0.5 + sample_conf / 2)
+        lo, hi = _count_bounds(counts, S, Q, z)
+        open_items = _boundary_items(lo, hi, K)
+        # Sampled queries whose own results hold an open item estimate the
+        # share of the rest that needs searching; the reach test can only
+        # keep more, so past one half it is skipped.
+        hit_share = np.isin(sample_ids, open_items).any(axis=1).mean() if len(open_items) else 0.0
+        needed = np.zeros(0, dtype=np.int64)
+        if len(rest) and len(open_items) and hit_share <= 0.5:
+            anchors = np.sort(np.random.default_rng(1).choice(S, min(S, max(256, N // 16)), replace=False))
+            test = _reach_test(index, kind, base, open_items, k,
+                               anchors=queries[sampled[anchors]], anchor_ids=sample_ids[anchors])
+            reach = np.zeros(len(rest), dtype=bool)
+            for s in range(0, len(rest), query_batch):
+                sel = rest[s:s + query_batch]
+                reach[s:s + len(sel)] = test(np.ascontiguousarray(queries[sel], dtype=np.float32))
+            needed = rest[reach]
+        if len(needed) > len(rest) / 2 or hit_share > 0.5:
+            needed = rest
+        log_value("open_hit_share", float(hit_share))
+        log_value("sample_queries", float(S))
+        log_value("boundary_items", float(len(open_items)))
+        log_value("needed_queries", float(len(needed)))
+
+        # Search needed queries while the budget lasts (0.75s kept in reserve).
+        extra = np.zeros(N, dtype=np.int64)
+        done = 0
+        while done < len(needed):
+            room = int((budget - t() - 0.75) / max(per_query, 1e-9))
+            if room <= 0:
+                break
+            step = needed[done:done + min(query_batch, room)]
+            count_rows(step, extra)
+            done += len(step)
+        log_value("queries_searched", float(S + done))
+
+        if done == len(rest):
+            counts = counts + extra
+        else:
+            # Sample counts scaled to Q, open items corrected by what was
+            # found among the needed queries (exact once all were searched).
+            est = counts * (Q / S)
+            if done:
+                est[open_items] = counts[open_items] + extra[open_items] * (len(needed) / done)
+            elif len(needed) == 0:
+                est[open_items] = counts[open_items]
+            counts = est
+        log_stage("final_search", time.perf_counter() - p_search)
+
+    elif stream:
+        # ── Streaming search + counting with early stop ────────────────────
+        p_search = time.perf_counter()
+        counts = np.zeros(N, dtype=np.int64)
+        done = 0
+        batch = stream_batch
+        while done < Q:
+            I = search(_rows(queries, done, done + batch))
+            flat = I.ravel()
+            counts += np.bincount(flat[flat >= 0], minlength=N)
+            done += len(I)
+            if done == Q:
+                break
+            margin = _topk_margin(counts, K, order_too=stream == "order")
+            if margin >= Q - done:
+                break
+            # The margin grows by at most 1 per query while the remainder
+            # shrinks by 1, so no check can succeed before (Q - done - margin) / 2.
+            batch = max(stream_batch, int(np.ceil((Q - done - margin) / 2)))
+        log_stage("final_search", time.perf_counter() - p_search)
+        log_value("queries_searched", float(done))
+    else:
+        # ── ANN search + frequency counting, one query batch at a time ─────
+        counts = np.zeros(N, dtype=np.int64)
+        search_seconds = count_seconds = 0.0
+        for s in range(0, Q, query_batch):
+            p_search = time.perf_counter()
+            I = search(_rows(queries, s, s + query_batch))   # I: (batch, k) – indices of k-NNs
+            p_count = time.perf_counter()
+            flat = I.ravel()
+            counts += np.bincount(flat[flat >= 0], minlength=N)
+            search_seconds += p_count - p_search
+            count_seconds += time.perf_counter() - p_count
+        log_stage("final_search", search_seconds)
+        log_stage("counting", count_seconds)
 
     # ── Rank: descending count, ties broken by ascending index ─────────────
     # np.argsort(kind='stable') preserves original order (0, 1, 2, …) for